@@ -0,0 +1,780 @@
+import re
+import os
+import argparse
+import json
+import random
+import time
+import asyncio
+import logging
+import platform
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Callable
+from corpus import CDT_CODES, generate_corpus
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+SAMPLE_LABELS = [
+    "Name", "Date of Birth", "Patient ID", "Gender", "Relationship", "Address", "Group Name",
+    "Account #", "Plan Type", "Plan Renews", "Other Insurance?", "Coverage From", "Coverage To",
+    "Family Max. Remaining", "Individual Deductible Remaining", "Oral Exam", "Bitewing X-Rays",
+    "Prophy Frequency", "Topical Fluoride", "Crown", "Bridge Work", "Quadrant", "Total",
+    "Member Responsibility", "History", "Network", "Claim Address", "Electronic Payer ID"
+]
+
+def timed(fn: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def synthetic_raw_keys(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    keys = []
+    while len(keys) < count:
+        label = rng.choice(SAMPLE_LABELS)
+        keys.append(f"{label} {len(keys)}" if label in keys else label)
+    return keys
+
+def bench_vectors(args) -> Dict:
+    import llm_mapper
+    from sentence_transformers import util
+
+    def legacy_scores(raw_keys, raw_embeddings):
+        index = llm_mapper.get_alias_index()
+        best = {}
+        for target, rows in index["rows"].items():
+            best_score, best_match = -1, None
+            for alias_emb in index["embeddings"][rows]:
+                for i, raw_emb in enumerate(raw_embeddings):
+                    score = util.cos_sim(alias_emb, raw_emb).item()
+                    if score > best_score:
+                        best_score = score
+                        best_match = raw_keys[i]
+            best[target] = (best_match, best_score)
+        return best
+
+    llm_mapper.get_alias_index()
+    results = []
+    for count in args.keys:
+        raw_keys = synthetic_raw_keys(count)
+        raw_embeddings = llm_mapper.model.encode(raw_keys, convert_to_numpy=True, normalize_embeddings=True)
+        legacy = legacy_scores(raw_keys, raw_embeddings)
+        current = llm_mapper.score_alias_matches(raw_keys, raw_embeddings)
+        same = all(legacy[t][0] == current[t][0] and abs(legacy[t][1] - current[t][1]) < 1e-4 for t in legacy)
+        legacy_s = timed(lambda: legacy_scores(raw_keys, raw_embeddings), args.repeat)
+        current_s = timed(lambda: llm_mapper.score_alias_matches(raw_keys, raw_embeddings), args.repeat)
+        results.append({
+            "raw_keys": count,
+            "legacy_ms": round(legacy_s * 1000, 3),
+            "matrix_ms": round(current_s * 1000, 3),
+            "speedup": round(legacy_s / current_s, 1) if current_s else None,
+            "same_matches": same
+        })
+    return {"benchmark": "vectors", "results": results}
+
+# The extract_insurance_kv cascade as it was before the precompiled rule engine, kept for comparison
+LEGACY_KV_PATTERNS = [
+    (r"^(Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Total)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(\$\d+[\d,.]*)\s*/\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(.+)$", 1, 2),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s{2,}(.+)$", 1, 2),
+    (r"^(D\d{4})\s+(.+)$", 1, 2),
+    (r"^([A-Z][A-Za-z ]+)\s+([\$%\d].*)$", 1, 2),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[-]\s*(.+)$", 1, 2),
+    (r"^\s*([A-Z][A-Za-z0-9 \-/():]+)\s*:\s*([^\n]+)$", 1, 2),
+    (r"^(.*)\s+\$([\d,.]+)$", 1, 2),
+    (r"^(.*)\s+(\d+%)$", 1, 2),
+    (r"^([A-Z][A-Za-z ]+)\s+([A-Za-z0-9 ,/]+)$", 1, 2),
+    (r"^(Other Insurance\?)\s+(.+)$", 1, 2),
+    (r"^(Pretreatment review.*)$", 0, 1),
+    (r"^(Family Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Deductible Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Deductible Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Calendar Year Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Calendar Year Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Calendar Year Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Calendar Year Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Maximum)\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Maximum)\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Family Deductible)\s*(\$\d+[\d,.]*)$", 1, 2),
+    (r"^(Individual Deductible)\s*(\$\d+[\d,.]*)$", 1, 2),
+]
+
+def legacy_extract_insurance_kv(text: str):
+    for pattern, key_group, value_group in LEGACY_KV_PATTERNS:
+        match = re.match(pattern, text, re.MULTILINE | re.DOTALL)
+        if match:
+            key = re.sub(r"\s+", " ", match.group(key_group).strip()) if key_group > 0 else match.group(1).strip()
+            value = re.sub(r"\s+", " ", match.group(value_group).strip())
+            return key, value
+    return None
+
+KV_VALUES = ["$1,500.00", "$50", "$0.00 / $100.00", "50%", "No", "01/01/2020", "Twice Per Calendar Year",
+             "DENTAL PPO", "Jane Doe", "- see notes", "100%"]
+KV_SEPARATORS = [": ", ":", " ", "  ", " - ", "\n", ": \n"]
+
+def synthetic_kv_blocks(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    labels = SAMPLE_LABELS + ["Family Maximum", "Individual Deductible", "Pretreatment review is available", "D0120"]
+    return [rng.choice(labels) + rng.choice(KV_SEPARATORS) + rng.choice(KV_VALUES) for _ in range(count)]
+
+def pdf_blocks(path: str) -> List[str]:
+    import fitz
+    with fitz.open(path) as doc:
+        return [block[4].strip() for page in doc for block in page.get_text("blocks") if block[4].strip()]
+
+def bench_kv(args) -> Dict:
+    from pdf_parser import extract_insurance_kv
+
+    blocks = pdf_blocks(args.pdf) if args.pdf else synthetic_kv_blocks(args.blocks)
+    mismatches = sum(1 for b in blocks if legacy_extract_insurance_kv(b) != extract_insurance_kv(b))
+    legacy_s = timed(lambda: [legacy_extract_insurance_kv(b) for b in blocks], args.repeat)
+    current_s = timed(lambda: [extract_insurance_kv(b) for b in blocks], args.repeat)
+    return {
+        "benchmark": "kv",
+        "blocks": len(blocks),
+        "legacy_blocks_per_sec": round(len(blocks) / legacy_s),
+        "compiled_blocks_per_sec": round(len(blocks) / current_s),
+        "speedup": round(legacy_s / current_s, 1),
+        "mismatches": mismatches
+    }
+
+def synthetic_pdf(pages: int, codes_per_page: int = 6, seed: int = 0) -> bytes:
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    first = [
+        "PATIENT DETAIL", "Name: Jane Doe", "Date of Birth: 10/21/1955", "Patient ID: 006202118",
+        "Gender: Female", "Relationship: Self", "PLAN AND NETWORK", "Plan Type: DENTAL PPO",
+        "Group Name: ACME CORP", "Account #: 3327706", "Other Insurance? No",
+        "PROCEDURE CODE SEARCH"
+    ]
+    for number in range(pages):
+        page = doc.new_page()
+        blocks = first if number == 0 else []
+        for _ in range(codes_per_page):
+            code, description = rng.choice(CDT_CODES)
+            blocks = blocks + [f"{code} {description}", f"Quadrant: {rng.choice(['UR', 'UL', 'LR', 'LL'])}",
+                               f"Total: ${rng.randint(20, 900)}.00", f"History Not: {rng.choice(['applicable', 'found'])}"]
+        y = 40
+        for text in blocks:
+            page.insert_text((40, y), text, fontsize=9)
+            y += 18
+            if y > page.rect.height - 40:
+                break
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def bench_pages(args) -> Dict:
+    import pdf_parser
+
+    data = synthetic_pdf(args.pages)
+    saved = pdf_parser.PARALLEL_PAGE_THRESHOLD
+    try:
+        pdf_parser.PARALLEL_PAGE_THRESHOLD = 0
+        serial = pdf_parser.parse_pdf(data)
+        serial_s = timed(lambda: pdf_parser.parse_pdf(data), args.repeat)
+        pdf_parser.PARALLEL_PAGE_THRESHOLD = 1
+        parallel = pdf_parser.parse_pdf(data)
+        parallel_s = timed(lambda: pdf_parser.parse_pdf(data), args.repeat)
+    finally:
+        pdf_parser.PARALLEL_PAGE_THRESHOLD = saved
+    return {
+        "benchmark": "pages",
+        "pages": args.pages,
+        "workers": pdf_parser.PARSE_WORKERS,
+        "serial_ms": round(serial_s * 1000, 1),
+        "parallel_ms": round(parallel_s * 1000, 1),
+        "speedup": round(serial_s / parallel_s, 2),
+        "same_output": serial == parallel
+    }
+
+def eager_logging_work(parsed: Dict) -> None:
+    # What the parser and endpoint formatted on every request before logging went lazy
+    for text in parsed["full_text"].split("\n"):
+        f"Processing block: {text}"
+    json.dumps(parsed["raw_data"], indent=2)
+    json.dumps(parsed["raw_data"].get("Procedure Codes", {}), indent=2)
+    json.dumps(parsed["procedure_codes"], indent=2)
+    json.dumps(parsed["raw_data"], indent=2)
+    json.dumps(parsed["benefits"], indent=2)
+    json.dumps(parsed, indent=2)
+    for code, fields in parsed["procedure_codes"].items():
+        for key, value in fields.items():
+            f"Extracted CDT subfield for {code}: {key} = {value}"
+
+def bench_logging(args) -> Dict:
+    import pdf_parser
+
+    logging.getLogger().setLevel(logging.INFO)
+    data = synthetic_pdf(args.pages)
+    parsed = pdf_parser.parse_pdf(data)
+
+    def cpu(fn) -> float:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.process_time()
+            fn()
+            best = min(best, time.process_time() - start)
+        return best
+
+    parse_s = cpu(lambda: pdf_parser.parse_pdf(data))
+    eager_s = cpu(lambda: eager_logging_work(parsed))
+    return {
+        "benchmark": "logging",
+        "pages": args.pages,
+        "procedure_codes": len(parsed["procedure_codes"]),
+        "parse_cpu_ms": round(parse_s * 1000, 1),
+        "eager_logging_cpu_ms_saved": round(eager_s * 1000, 1),
+        "saved_pct_of_parse": round(100 * eager_s / (parse_s + eager_s), 1)
+    }
+
+# parse_pdf as it was before results were kept compact: nested defaultdicts, every derived shape built up front.
+# Kept (minus events, logging and the layout fingerprint) so bench memory has a baseline to measure against.
+LEGACY_SERVICE_PATTERN = r"^(Diagnostic and Preventive|Basic Restorative|Major Restorative|Orthodontics)(?:,\s*(?:Diagnostic and Preventive|Basic Restorative|Major Restorative|Orthodontics))*$"
+
+def legacy_parse_pdf(source) -> Dict:
+    from pdf_parser import (open_pdf, iter_prepared_pages, is_section_heading, extract_insurance_kv, extract_patient_data,
+                            extract_plan_data, extract_benefits_data, extract_procedure_dates, extract_procedure_codes)
+
+    doc = open_pdf(source)
+    data = defaultdict(dict)
+    full_text = []
+    tables = []
+    current_section = None
+    current_subsection = None
+    current_field = None
+    benefits_data = defaultdict(lambda: defaultdict(dict))
+    procedure_codes = defaultdict(dict)
+    last_key = None
+    partial_key = ""
+    current_services = ""
+    try:
+        for block_texts, page_tables in iter_prepared_pages(doc, source):
+            for text in block_texts:
+                full_text.append(text)
+                if is_section_heading(text):
+                    current_section = text.strip().title()
+                    current_subsection = None
+                    current_field = None
+                    partial_key = ""
+                    last_key = None
+                    current_services = ""
+                    continue
+                if current_section and current_section.lower() == "benefits":
+                    if partial_key and not text.startswith("  ") and not text.lower().startswith("total:") and not re.match(r'^\$\d+[\d,.]*$', text):
+                        if last_key:
+                            benefits_data[current_subsection or "General"][last_key] = {"Text": partial_key.strip()}
+                        partial_key = ""
+                    if text.lower() == "benefit maximums":
+                        current_subsection = "Benefit Maximums"
+                        current_field = None
+                        current_services = ""
+                        continue
+                    elif text.lower() == "orthodontics" and current_subsection == "Benefit Maximums":
+                        benefits_data[current_subsection]["Orthodontics"] = {}
+                        current_field = None
+                        current_services = ""
+                        continue
+                    if re.match(LEGACY_SERVICE_PATTERN, text) and not text.lower().startswith("total:"):
+                        current_services = text.strip()
+                        continue
+                    if "deductible remaining" in text.lower() and current_subsection != "Benefit Maximums":
+                        current_subsection = "Deductible"
+                        if current_services:
+                            benefits_data[current_subsection]["Services"] = current_services
+                        current_services = ""
+                    if not text.startswith("  "):
+                        remaining_match = re.match(r"^(.*)\s+remaining\s*[:]\s*(\$\d+[\d,.]*)$", text)
+                        if remaining_match:
+                            current_field = remaining_match.group(1).strip()
+                            if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
+                                benefits_data[current_subsection]["Orthodontics"][current_field] = {"Remaining": remaining_match.group(2)}
+                            else:
+                                benefits_data[current_subsection or "General"][current_field] = {"Remaining": remaining_match.group(2)}
+                            last_key = current_field
+                        elif re.match(r'^\$\d+[\d,.]*$', text):
+                            continue
+                        else:
+                            current_field = text.strip()
+                            if not current_field.startswith("Total:"):
+                                benefits_data[current_subsection or "General"][current_field] = {}
+                                last_key = current_field
+                                partial_key = current_field
+                            continue
+                    if current_field:
+                        if text.startswith("  "):
+                            kv = extract_insurance_kv(text.strip())
+                            if kv:
+                                key, value = kv
+                                if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
+                                    benefits_data[current_subsection]["Orthodontics"][current_field][key] = value
+                                else:
+                                    benefits_data[current_subsection or "General"][current_field][key] = value
+                                continue
+                        elif text.lower().startswith("total:"):
+                            match = re.match(r"^Total\s*[:]\s*(\$\d+[\d,.]*)$", text)
+                            if match:
+                                if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
+                                    benefits_data[current_subsection]["Orthodontics"][current_field]["Total"] = match.group(1)
+                                else:
+                                    benefits_data[current_subsection or "General"][current_field]["Total"] = match.group(1)
+                                current_field = None
+                                last_key = None
+                        else:
+                            partial_key += " " + text.strip()
+                            continue
+                elif current_section and current_section.lower() == "procedure code search":
+                    cdt_match = re.match(r"^(D\d{4})\s*(.*?)(?=\n|$)", text, re.DOTALL)
+                    if cdt_match:
+                        current_field = f"{cdt_match.group(1)} - {cdt_match.group(2).strip().replace(chr(10), ' ')}"
+                        procedure_codes[current_field] = {}
+                        last_key = current_field
+                        partial_key = ""
+                        continue
+                    if current_field:
+                        kv = extract_insurance_kv(text.strip())
+                        if kv:
+                            key, value = kv
+                            if key == "History Not":
+                                procedure_codes[current_field]["History"] = f"Not {value}"
+                            elif key == "Alternate benefit may":
+                                procedure_codes[current_field]["Note"] = f"Alternate benefit may {value}"
+                            elif key == "Member":
+                                procedure_codes[current_field]["Member Responsibility"] = value
+                            else:
+                                procedure_codes[current_field][key] = value
+                        else:
+                            partial_key += " " + text.strip()
+                        continue
+                kv = extract_insurance_kv(text)
+                if kv:
+                    key, value = kv
+                    if current_section:
+                        data[current_section][key] = value
+                    else:
+                        data[key] = value
+            tables.extend(page_tables)
+
+        if partial_key and last_key:
+            if current_section.lower() == "procedure code search":
+                procedure_codes[last_key] = {"Text": partial_key.strip()}
+            else:
+                benefits_data[current_subsection or "General"][last_key] = {"Text": partial_key.strip()}
+        if benefits_data:
+            data["Benefits"] = dict(benefits_data)
+        if procedure_codes:
+            data["Procedure Codes"] = dict(procedure_codes)
+        return {
+            "patient_info": extract_patient_data(data),
+            "plan_info": extract_plan_data(data),
+            "benefits": extract_benefits_data(doc, data),
+            "last_procedures": extract_procedure_dates(data),
+            "procedure_codes": extract_procedure_codes(data),
+            "raw_data": dict(data),
+            "tables": tables,
+            "full_text": "\n".join(full_text)
+        }
+    finally:
+        doc.close()
+
+def dict_service_parse(data: bytes) -> tuple:
+    # The full nested result dict plus its flattened copy, which is what /parse-pdf/ used to hold per document
+    parsed = legacy_parse_pdf(data)
+    flat = {}
+    for section, section_data in parsed["raw_data"].items():
+        if isinstance(section_data, dict):
+            flat.update(section_data)
+        else:
+            flat[section] = section_data
+    return parsed, flat
+
+def compact_service_parse(data: bytes) -> tuple:
+    import pdf_parser
+
+    parsed = pdf_parser.parse_pdf(data, compact=True)
+    return parsed, parsed.flat_fields()
+
+def traced(fn: Callable) -> Dict:
+    import gc
+    import pickle
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+        retained = tracemalloc.take_snapshot().statistics("filename")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "ms": round(seconds * 1000, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "retained_kb": round(sum(stat.size for stat in retained) / 1024, 1),
+        "retained_blocks": sum(stat.count for stat in retained),
+        # What a process-pool worker ships back to the event loop
+        "pickled_kb": round(len(pickle.dumps(result[0])) / 1024, 1)
+    }
+
+def procedure_code_pdf(pages: int, codes: int, seed: int = 0) -> bytes:
+    # Every code distinct, like a full fee schedule export; the corpus documents repeat a handful of codes
+    from corpus import document_lines, render_pdf
+
+    rng = random.Random(seed)
+    lines = document_lines("delta", "remaining", 0, rng)
+    for number in range(codes):
+        lines += [
+            f"D{number % 10000:04d} {rng.choice(CDT_CODES)[1]}",
+            f"Quadrant: {rng.choice(['UR', 'UL', 'LR', 'LL'])}",
+            f"Total: ${rng.randint(20, 900)}.00",
+            f"History Not: {rng.choice(['applicable', 'found'])}"
+        ]
+    return render_pdf(lines, pages)
+
+def bench_memory(args) -> Dict:
+    import pdf_parser
+
+    # Pages are extracted in this process, so tracemalloc sees all of the parse on both sides
+    pdf_parser.PARALLEL_PAGE_THRESHOLD = 0
+    data = procedure_code_pdf(args.pages, args.codes, args.seed)
+    parsed = pdf_parser.parse_pdf(data, compact=True)
+    # Warm regex and dispatch caches so neither run pays for them
+    expected = dict_service_parse(data)[0]
+    compact_service_parse(data)
+    as_dict = traced(lambda: dict_service_parse(data))
+    compact = traced(lambda: compact_service_parse(data))
+    # The legacy copy builds no layout fingerprint
+    actual = parsed.to_dict()
+    actual.pop("fingerprint")
+    return {
+        "benchmark": "memory",
+        "pages": args.pages,
+        "procedure_codes": len(parsed.procedure_codes),
+        "same_output": expected == actual,
+        "dict": as_dict,
+        "compact": compact,
+        "peak_saved_pct": round(100 * (1 - compact["peak_kb"] / as_dict["peak_kb"]), 1) if as_dict["peak_kb"] else 0.0,
+        "retained_saved_pct": round(100 * (1 - compact["retained_kb"] / as_dict["retained_kb"]), 1) if as_dict["retained_kb"] else 0.0
+    }
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    # Nearest-rank percentile; exact for the small sample sizes a benchmark run produces
+    rank = max(1, -(-len(sorted_samples) * pct // 100))
+    return sorted_samples[int(rank) - 1]
+
+def peak_rss_mb() -> Dict:
+    try:
+        import resource
+    except ImportError:
+        return {}
+    # ru_maxrss is KiB on Linux and bytes on macOS; children covers the parse and pipeline process pools
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+def latency_report(latencies: List[float], wall: float, errors: int = 0) -> Dict:
+    ordered = sorted(latencies)
+    report = {"docs": len(latencies), "errors": errors, "wall_s": round(wall, 3),
+              "docs_per_sec": round(len(latencies) / wall, 2) if wall else None}
+    if ordered:
+        for pct in (50, 95, 99):
+            report[f"p{pct}_ms"] = round(percentile(ordered, pct) * 1000, 2)
+        report["max_ms"] = round(ordered[-1] * 1000, 2)
+    report.update(peak_rss_mb())
+    return report
+
+def run_concurrently(fn: Callable, items: List, concurrency: int) -> Dict:
+    from concurrent.futures import ThreadPoolExecutor
+
+    def timed_call(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed_call, items))
+    return latency_report(latencies, time.perf_counter() - start)
+
+async def post_corpus(app, corpus: List[Dict], concurrency: int) -> Dict:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def post(client, document):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/parse-pdf/", files={"file": (document["name"], document["data"], "application/pdf")})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(post(client, document) for document in corpus))
+        wall = time.perf_counter() - start
+    return latency_report(latencies, wall, errors)
+
+def bench_suite(args) -> Dict:
+    from ollama_stub import start_stub_server
+
+    # The stub has to be up before llm_client is imported, since the client reads OLLAMA_URL at import
+    stub = start_stub_server(token_delay=args.llm_delay)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{stub.server_address[1]}"
+    import pdf_parser
+    import llm_mapper
+    import main as service
+
+    corpus = generate_corpus(args.docs, args.seed, args.pages, args.codes)
+    stages = {}
+    stages["parse_pdf"] = run_concurrently(lambda document: pdf_parser.parse_pdf(document["data"], compact=True), corpus, 1)
+
+    parsed = [pdf_parser.parse_pdf(document["data"], compact=True) for document in corpus]
+    llm_mapper.get_alias_index()
+    llm_mapper.raw_key_cache.clear()
+    llm_mapper.llm_cache.clear()
+    stages["hybrid_field_mapper"] = run_concurrently(
+        # Flattened the way the service hands fields to the mapper
+        lambda result: llm_mapper.hybrid_field_mapper(result.flat_fields(), result.tables, result.fingerprint), parsed, 1)
+
+    # The ASGI transport does not run the lifespan, so warm the index the way its startup would
+    service.load_alias_index()
+    for concurrency in args.concurrency:
+        service.result_cache.clear()
+        llm_mapper.llm_cache.clear()
+        stages[f"endpoint_c{concurrency}"] = asyncio.run(post_corpus(service.app, corpus, concurrency))
+    stub.shutdown()
+    return {
+        "benchmark": "suite",
+        "corpus": {"docs": len(corpus), "seed": args.seed, "pages": args.pages, "codes": args.codes,
+                   "bytes": sum(len(document["data"]) for document in corpus)},
+        "llm_stub_requests": len(stub.requests_seen),
+        "stages": stages
+    }
+
+COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.warm_model()
+warm = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "warm_s": warm - imported, "model": main.model.status()}))
+"""
+
+def bench_coldstart(args) -> Dict:
+    import subprocess
+    import sys
+
+    # Each run is a fresh interpreter, so nothing is shared with this process or earlier runs
+    env = dict(os.environ, MODEL_PRELOAD="lazy", LOG_LEVEL="WARNING")
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT], cwd=app_dir, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        total = time.perf_counter() - start
+        run = json.loads(output.strip().splitlines()[-1])
+        run["process_s"] = total
+        runs.append(run)
+    return {
+        "benchmark": "coldstart",
+        "runs": len(runs),
+        "import_main_s": round(min(run["import_s"] for run in runs), 3),
+        "model_warm_s": round(min(run["warm_s"] for run in runs), 3),
+        "process_total_s": round(min(run["process_s"] for run in runs), 3),
+        "model": runs[-1]["model"]
+    }
+
+def bench_backend_worker(args) -> Dict:
+    # Runs in its own interpreter per backend (see bench_backends), so RSS reflects that backend alone
+    import numpy as np
+    import llm_mapper
+
+    start = time.perf_counter()
+    llm_mapper.model.load()
+    llm_mapper.get_alias_index()
+    warm_s = time.perf_counter() - start
+    raw_keys = synthetic_raw_keys(args.keys)
+    raw_data = {key: f"value {i}" for i, key in enumerate(raw_keys)}
+
+    def uncached_map():
+        llm_mapper.raw_key_cache.clear()
+        return llm_mapper.map_fields_with_vectors(raw_data, return_scores=True)
+
+    mapped, _ = uncached_map()
+    embeddings = llm_mapper.model.encode(raw_keys, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    best = llm_mapper.score_alias_matches(raw_keys, embeddings)
+    np.save(args.embeddings, embeddings)
+    return {
+        "backend": llm_mapper.EMBEDDING_BACKEND,
+        "warm_s": round(warm_s, 3),
+        "encode_ms": round(timed(lambda: llm_mapper.model.encode(raw_keys, batch_size=64, convert_to_numpy=True,
+                                                                 normalize_embeddings=True), args.repeat) * 1000, 2),
+        "map_fields_with_vectors_ms": round(timed(uncached_map, args.repeat) * 1000, 2),
+        **peak_rss_mb(),
+        "mapped": mapped,
+        "best": {f"{target}.{sub_target}" if sub_target else target: [match, score]
+                 for (target, sub_target), (match, score) in best.items()}
+    }
+
+def bench_backends(args) -> Dict:
+    import subprocess
+    import sys
+    import tempfile
+    import numpy as np
+
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = {}
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            path = os.path.join(tmp, f"{backend}.npy")
+            # No caches or saved index, so every backend encodes everything itself
+            env = dict(os.environ, EMBEDDING_BACKEND=backend, EMBEDDING_MODEL_PATH=args.model_path or "",
+                       EMBEDDING_CACHE_PATH="", ALIAS_INDEX_PATH="", LOG_LEVEL="WARNING")
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "backend-worker", "--keys", str(args.keys),
+                 "--repeat", str(args.repeat), "--embeddings", path],
+                cwd=app_dir, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            runs[backend] = json.loads(output[output.index("{"):])
+            embeddings[backend] = np.load(path)
+
+    reference_name = args.backends[0]
+    reference = runs[reference_name]
+    results = []
+    for backend, run in runs.items():
+        row = {key: run[key] for key in ("backend", "warm_s", "encode_ms", "map_fields_with_vectors_ms",
+                                         "peak_rss_mb") if key in run}
+        if backend != reference_name:
+            # Both sides are L2-normalized, so the row-wise dot product is the cosine similarity
+            cosine = (embeddings[backend] * embeddings[reference_name]).sum(axis=1)
+            score_diffs = [abs(run["best"][t][1] - reference["best"][t][1]) for t in reference["best"]]
+            same_best = sum(run["best"][t][0] == reference["best"][t][0] for t in reference["best"])
+            same_mapped = run["mapped"] == reference["mapped"]
+            row.update({
+                "min_cosine_to_reference": round(float(cosine.min()), 5),
+                "max_score_diff": round(max(score_diffs), 5),
+                "best_match_agreement": round(same_best / len(reference["best"]), 4),
+                "same_mapped_fields": same_mapped,
+                "within_tolerance": max(score_diffs) <= args.tolerance and same_mapped
+            })
+        results.append(row)
+    return {"benchmark": "backends", "reference": reference_name, "raw_keys": args.keys,
+            "tolerance": args.tolerance, "results": results}
+
+def bench_compare(args) -> Dict:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    stages = {}
+    for name, before in baseline.get("stages", {}).items():
+        after = current.get("stages", {}).get(name)
+        if not after:
+            continue
+        # Ratios above 1.0 are improvements: lower latency, higher throughput
+        stages[name] = {
+            metric: round(before[metric] / after[metric], 2) if metric.endswith("_ms") else round(after[metric] / before[metric], 2)
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "docs_per_sec")
+            if before.get(metric) and after.get(metric)
+        }
+    return {"benchmark": "compare", "baseline": args.baseline, "current": args.current, "improvement": stages}
+
+BENCHMARKS = {
+    "vectors": bench_vectors,
+    "kv": bench_kv,
+    "pages": bench_pages,
+    "logging": bench_logging,
+    "memory": bench_memory,
+    "suite": bench_suite,
+    "coldstart": bench_coldstart,
+    "backends": bench_backends,
+    "backend-worker": bench_backend_worker,
+    "compare": bench_compare,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks for the PDF mapper")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    vectors = sub.add_parser("vectors", help="Alias x raw-key similarity matching")
+    vectors.add_argument("--keys", type=int, nargs="+", default=[100, 250, 500])
+    vectors.add_argument("--repeat", type=int, default=3)
+    kv = sub.add_parser("kv", help="extract_insurance_kv throughput, legacy cascade vs compiled rules")
+    kv.add_argument("--blocks", type=int, default=20000)
+    kv.add_argument("--pdf", help="Use the text blocks of this PDF instead of synthetic blocks")
+    kv.add_argument("--repeat", type=int, default=3)
+    pages = sub.add_parser("pages", help="parse_pdf on a synthetic long PDF, serial vs process pool")
+    pages.add_argument("--pages", type=int, default=100)
+    pages.add_argument("--repeat", type=int, default=3)
+    log_bench = sub.add_parser("logging", help="Per-request CPU the lazy logging layer no longer spends at INFO")
+    log_bench.add_argument("--pages", type=int, default=20)
+    log_bench.add_argument("--repeat", type=int, default=3)
+    memory = sub.add_parser("memory", help="Peak and retained parse memory on a procedure-code heavy PDF, dict vs compact results")
+    memory.add_argument("--pages", type=int, default=20)
+    memory.add_argument("--codes", type=int, default=2000)
+    memory.add_argument("--seed", type=int, default=0)
+    suite = sub.add_parser("suite", help="parse_pdf, hybrid_field_mapper and /parse-pdf/ over a synthetic corpus")
+    suite.add_argument("--docs", type=int, default=40)
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--pages", type=int, nargs="+", default=[1, 2, 5, 20])
+    suite.add_argument("--codes", type=int, nargs="+", default=[0, 6, 25, 100])
+    suite.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    suite.add_argument("--llm-delay", type=float, default=0.0, help="Seconds the stub LLM waits between tokens")
+    coldstart = sub.add_parser("coldstart", help="Fresh-interpreter import and model warm-up time")
+    coldstart.add_argument("--repeat", type=int, default=3)
+    backends = sub.add_parser("backends", help="Latency, RSS and score drift of each embedding backend")
+    backends.add_argument("--backends", nargs="+", default=["sentence-transformers", "onnx", "onnx-int8"],
+                          help="The first backend is the reference the others are checked against")
+    backends.add_argument("--model-path", help="Directory written by embedding_backends.py, for the ONNX backends")
+    backends.add_argument("--keys", type=int, default=250)
+    backends.add_argument("--repeat", type=int, default=5)
+    backends.add_argument("--tolerance", type=float, default=float(os.getenv("EMBEDDING_TOLERANCE", "0.02")),
+                          help="Largest allowed difference in a target's best similarity score")
+    worker = sub.add_parser("backend-worker")
+    worker.add_argument("--keys", type=int, required=True)
+    worker.add_argument("--repeat", type=int, required=True)
+    worker.add_argument("--embeddings", required=True)
+    compare = sub.add_parser("compare", help="Compare two saved suite results")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    for subparser in sub.choices.values():
+        subparser.add_argument("--output", help="Also write the result JSON to this file")
+    args = parser.parse_args()
+    result = BENCHMARKS[args.benchmark](args)
+    result["environment"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
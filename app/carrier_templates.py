@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class CarrierTemplates:
+    # Per-layout extraction plans: form field ("target" or "target.sub_target") -> raw key to read it from.
+    # Plans are learned from the vector mapper's matches on documents with the same layout fingerprint,
+    # or pinned by hand in a JSON file.
+    def __init__(self, version: str, path: Optional[str] = None, min_observations: int = 3):
+        self.version = version
+        self.path = path
+        self.min_observations = min_observations
+        self._counts = {}
+        self._pinned = {}
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.full_hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS template_matches ("
+                "version TEXT NOT NULL, fingerprint TEXT NOT NULL, field TEXT NOT NULL, raw_key TEXT NOT NULL, "
+                "count INTEGER NOT NULL, PRIMARY KEY (version, fingerprint, field, raw_key))"
+            )
+            self._db.commit()
+            for fingerprint, field, raw_key, count in self._db.execute(
+                    "SELECT fingerprint, field, raw_key, count FROM template_matches WHERE version = ?", (version,)):
+                self._counts.setdefault(fingerprint, {}).setdefault(field, {})[raw_key] = count
+            logger.info(f"Using carrier templates at {path} ({len(self._counts)} layouts)")
+
+    def load_pinned(self, path: str) -> int:
+        # {"<fingerprint>": {"carrier": "...", "fields": {"subscriberId": "Patient ID", ...}}}
+        with open(path) as f:
+            pinned = json.load(f)
+        with self._lock:
+            self._pinned = {fingerprint: dict(entry["fields"]) for fingerprint, entry in pinned.items()}
+            self._plans.clear()
+        logger.info(f"Loaded {len(self._pinned)} pinned carrier templates from {path}")
+        return len(self._pinned)
+
+    def _compile(self, fingerprint: str) -> Dict[str, str]:
+        plan = {}
+        for field, raw_keys in self._counts.get(fingerprint, {}).items():
+            # A field joins the plan only once every observation agreed on the same raw key
+            if len(raw_keys) == 1:
+                raw_key, count = next(iter(raw_keys.items()))
+                if count >= self.min_observations:
+                    plan[field] = raw_key
+        plan.update(self._pinned.get(fingerprint, {}))
+        return plan
+
+    def plan_for(self, fingerprint: Optional[str]) -> Dict[str, str]:
+        if not fingerprint:
+            return {}
+        with self._lock:
+            plan = self._plans.get(fingerprint)
+            if plan is None:
+                plan = self._plans[fingerprint] = self._compile(fingerprint)
+            return plan
+
+    def observe(self, fingerprint: Optional[str], matches: Dict[str, str]) -> None:
+        if not fingerprint or not matches:
+            return
+        with self._lock:
+            fields = self._counts.setdefault(fingerprint, {})
+            for field, raw_key in matches.items():
+                raw_keys = fields.setdefault(field, {})
+                raw_keys[raw_key] = raw_keys.get(raw_key, 0) + 1
+            self._plans.pop(fingerprint, None)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT INTO template_matches (version, fingerprint, field, raw_key, count) VALUES (?, ?, ?, ?, 1) "
+                    "ON CONFLICT (version, fingerprint, field, raw_key) DO UPDATE SET count = count + 1",
+                    [(self.version, fingerprint, field, raw_key) for field, raw_key in matches.items()]
+                )
+                self._db.commit()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            if outcome == "full":
+                self.full_hits += 1
+            elif outcome == "partial":
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            layouts = set(self._counts) | set(self._pinned)
+            documents = self.full_hits + self.partial_hits + self.misses
+            return {
+                "layouts": len(layouts),
+                "layouts_with_plan": sum(1 for fingerprint in layouts if self._compile(fingerprint)),
+                "pinned": len(self._pinned),
+                "full_hits": self.full_hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+                "fast_path_rate": round(self.full_hits / documents, 4) if documents else 0.0
+            }
@@ -0,0 +1,183 @@
+import os
+import json
+import random
+import argparse
+from typing import Dict, List
+
+CDT_CODES = [
+    ("D0120", "Periodic oral evaluation"), ("D0150", "Comprehensive oral evaluation"),
+    ("D0210", "Intraoral - complete series of radiographic images"), ("D0274", "Bitewings - four radiographic images"),
+    ("D1110", "Prophylaxis - adult"), ("D1208", "Topical application of fluoride"),
+    ("D1351", "Sealant - per tooth"), ("D2740", "Crown - porcelain/ceramic"),
+    ("D4341", "Periodontal scaling and root planing"), ("D6240", "Pontic - porcelain fused to high noble metal"),
+]
+
+# Section headings and field labels differ between carrier portals; the mapper has to cope with all of them
+CARRIERS = {
+    "delta": {
+        "provider": "Delta Dental PPO Plus Premier",
+        "sections": {"patient": "PATIENT DETAIL", "plan": "PLAN AND NETWORK", "benefits": "BENEFITS",
+                     "frequency": "FREQUENCY & LIMITATIONS", "codes": "PROCEDURE CODE SEARCH"},
+        "labels": {"name": "Name", "dob": "Date of Birth", "id": "Patient ID", "group": "Group Name",
+                   "plan": "Plan Type", "account": "Account #", "effective": "Coverage From", "termination": "Coverage To"}
+    },
+    "metlife": {
+        "provider": "MetLife PDP Plus",
+        "sections": {"patient": "PATIENT INFORMATION", "plan": "PLAN DETAILS", "benefits": "BENEFITS",
+                     "frequency": "FREQUENCY & LIMITATIONS", "codes": "PROCEDURE CODE SEARCH"},
+        "labels": {"name": "Member Name", "dob": "DOB", "id": "Member ID", "group": "Employer",
+                   "plan": "Plan", "account": "Group Number", "effective": "Effective Date", "termination": "Termination Date"}
+    },
+    "cigna": {
+        "provider": "Cigna Dental 1500",
+        "sections": {"patient": "PATIENT DETAILS", "plan": "PLAN SUMMARY", "benefits": "BENEFITS",
+                     "frequency": "FREQUENCY & LIMITATIONS", "codes": "PROCEDURE CODE SEARCH"},
+        "labels": {"name": "Patient Name", "dob": "Birth Date", "id": "Subscriber ID", "group": "Group",
+                   "plan": "Network", "account": "Policy #", "effective": "Plan Begins", "termination": "Plan Ends"}
+    }
+}
+
+# How a carrier prints remaining/total amounts under Benefits
+BENEFIT_LAYOUTS = ("remaining", "stacked", "columns")
+
+BENEFIT_FIELDS = [
+    ("Deductible", "Individual Calendar Year Deductible", 50, 100),
+    ("Deductible", "Family Calendar Year Deductible", 150, 300),
+    ("Benefit Maximums", "Individual Calendar Year Maximum", 1500, 2000),
+    ("Benefit Maximums", "Family Calendar Year Maximum", 3000, 4000),
+]
+
+FREQUENCY_ROWS = [
+    ("Oral Exam", "Twice Per Calendar Year"), ("Bitewing X-Rays", "Once Per Calendar Year"),
+    ("Full Mouth X-Rays", "Once Every 5 Years"), ("Prophy Frequency", "Twice Per Calendar Year"),
+    ("Topical Fluoride", "Once Per Calendar Year"),
+]
+
+FIRST_NAMES = ["Jane", "John", "Maria", "Wei", "Aisha", "Carlos", "Priya", "Tom"]
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Chen", "Khan", "Lopez", "Patel", "Brown"]
+
+def _money(amount: int) -> str:
+    return f"${amount:,}.00"
+
+def benefit_lines(layout: str, rng: random.Random) -> List[str]:
+    lines = []
+    previous = None
+    for subsection, field, remaining, total in BENEFIT_FIELDS:
+        if subsection != previous:
+            # Deductibles are introduced by the services they apply to, maximums by their own heading
+            lines.append("Benefit Maximums" if subsection == "Benefit Maximums"
+                         else "Diagnostic and Preventive, Basic Restorative, Major Restorative")
+            previous = subsection
+        left = _money(rng.randint(0, remaining))
+        if layout == "remaining":
+            lines += [f"{field} remaining: {left}", f"Total: {_money(total)}"]
+        elif layout == "stacked":
+            lines += [field, left, f"Total: {_money(total)}"]
+        else:
+            lines.append(f"{field}  {left}  {_money(total)}")
+    return lines
+
+def document_lines(carrier: str, layout: str, codes: int, rng: random.Random) -> List[str]:
+    spec = CARRIERS[carrier]
+    sections = spec["sections"]
+    labels = spec["labels"]
+    year = rng.randint(2019, 2026)
+    lines = [
+        sections["patient"],
+        f"{labels['name']}: {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        f"{labels['dob']}: {rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2015)}",
+        f"{labels['id']}: {rng.randint(10 ** 8, 10 ** 9 - 1)}",
+        f"Gender: {rng.choice(['Female', 'Male'])}",
+        f"Relationship: {rng.choice(['Self', 'Spouse', 'Child'])}",
+        sections["plan"],
+        f"{labels['plan']}: DENTAL PPO",
+        f"Insurance Provider: {spec['provider']}",
+        f"{labels['group']}: {rng.choice(['ACME CORP', 'GLOBEX', 'INITECH', 'UMBRELLA LLC'])}",
+        f"{labels['account']}: {rng.randint(10 ** 6, 10 ** 7 - 1)}",
+        f"{labels['effective']}: 01/01/{year}",
+        f"{labels['termination']}: 12/31/{year}",
+        f"Other Insurance? {rng.choice(['No', 'Yes'])}",
+        sections["benefits"],
+    ]
+    lines += benefit_lines(layout, rng)
+    lines.append(sections["frequency"])
+    lines += [f"{procedure}  {frequency}" for procedure, frequency in FREQUENCY_ROWS]
+    lines.append(sections["codes"])
+    for _ in range(codes):
+        code, description = rng.choice(CDT_CODES)
+        lines += [
+            f"{code} {description}",
+            f"Quadrant: {rng.choice(['UR', 'UL', 'LR', 'LL'])}",
+            f"Total: ${rng.randint(20, 900)}.00",
+            f"History Not: {rng.choice(['applicable', 'found'])}"
+        ]
+    return lines
+
+def render_pdf(lines: List[str], pages: int = 1) -> bytes:
+    import fitz
+    doc = fitz.open()
+    # Spread the lines over at least `pages` pages; anything that does not fit spills onto extra pages
+    per_page = max(1, -(-len(lines) // max(1, pages)))
+    page = None
+    y = 0
+    for number, text in enumerate(lines):
+        if page is None or number % per_page == 0 or y > page.rect.height - 40:
+            page = doc.new_page()
+            y = 40
+        page.insert_text((40, y), text, fontsize=9)
+        y += 18
+    while len(doc) < pages:
+        doc.new_page()
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def synthetic_document(pages: int = 1, codes: int = 6, layout: str = "remaining", carrier: str = "delta",
+                       seed: int = 0) -> bytes:
+    if layout not in BENEFIT_LAYOUTS:
+        raise ValueError(f"Unknown benefits layout: {layout}")
+    if carrier not in CARRIERS:
+        raise ValueError(f"Unknown carrier: {carrier}")
+    return render_pdf(document_lines(carrier, layout, codes, random.Random(seed)), pages)
+
+def generate_corpus(count: int, seed: int = 0, page_counts=(1, 2, 5, 20), code_counts=(0, 6, 25, 100)) -> List[Dict]:
+    rng = random.Random(seed)
+    corpus = []
+    for number in range(count):
+        spec = {
+            "name": f"synthetic-{seed}-{number:04d}.pdf",
+            "carrier": rng.choice(sorted(CARRIERS)),
+            "layout": rng.choice(BENEFIT_LAYOUTS),
+            "pages": rng.choice(page_counts),
+            "codes": rng.choice(code_counts),
+            "seed": rng.randrange(2 ** 31)
+        }
+        spec["data"] = synthetic_document(spec["pages"], spec["codes"], spec["layout"], spec["carrier"], spec["seed"])
+        corpus.append(spec)
+    return corpus
+
+def write_corpus(corpus: List[Dict], directory: str) -> str:
+    os.makedirs(directory, exist_ok=True)
+    manifest = []
+    for document in corpus:
+        with open(os.path.join(directory, document["name"]), "wb") as f:
+            f.write(document["data"])
+        manifest.append({key: value for key, value in document.items() if key != "data"})
+    manifest_path = os.path.join(directory, "manifest.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic eligibility PDFs for benchmarking")
+    parser.add_argument("output", help="Directory to write the PDFs and manifest.json into")
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 2, 5, 20])
+    parser.add_argument("--codes", type=int, nargs="+", default=[0, 6, 25, 100])
+    args = parser.parse_args()
+    corpus = generate_corpus(args.docs, args.seed, args.pages, args.codes)
+    print(f"Wrote {len(corpus)} documents, manifest at {write_corpus(corpus, args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import json
+import argparse
+import logging
+import numpy as np
+from typing import Callable, List, Union
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+ONNX_CONFIG_FILE = "embedding_config.json"
+# 0 lets ONNX Runtime pick; set it to the worker's CPU share when several workers run per node
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+class OnnxEncoder:
+    # Mean-pooled MiniLM embeddings from an exported ONNX graph; same encode() surface as SentenceTransformer
+    def __init__(self, model_file: str, tokenizer_file: str, max_length: int = 256, threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("[PAD]") or 0)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(sentences[start:start + batch_size])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            weights = mask[..., None].astype(np.float32)
+            batches.append((hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None))
+        embeddings = np.vstack(batches) if batches else np.zeros((0, self.dimension), dtype=np.float32)
+        if normalize_embeddings:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+def _load_sentence_transformer() -> Callable:
+    from sentence_transformers import SentenceTransformer
+
+    def load(model_name: str, model_path: str):
+        return SentenceTransformer(model_path or model_name)
+    return load
+
+def _load_onnx(backend: str) -> Callable:
+    try:
+        import onnxruntime
+        import tokenizers
+    except ImportError as e:
+        raise RuntimeError(f"EMBEDDING_BACKEND={backend} needs onnxruntime and tokenizers installed: {e}")
+
+    def load(model_name: str, model_path: str):
+        if not model_path:
+            raise RuntimeError(f"EMBEDDING_BACKEND={backend} needs EMBEDDING_MODEL_PATH (see embedding_backends.py export)")
+        directory = model_path if os.path.isdir(model_path) else os.path.dirname(model_path)
+        model_file = os.path.join(model_path, ONNX_FILES[backend]) if os.path.isdir(model_path) else model_path
+        max_length = 256
+        config_path = os.path.join(directory, ONNX_CONFIG_FILE)
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+            if config.get("model_name") != model_name:
+                logger.warning("ONNX export at %s is for %s, not %s", directory, config.get("model_name"), model_name)
+            max_length = config.get("max_seq_length", max_length)
+        return OnnxEncoder(model_file, os.path.join(directory, "tokenizer.json"), max_length)
+    return load
+
+def backend_loader(backend: str) -> Callable:
+    # Importing the backend's libraries is the slow half of a cold start, so it is split out to be timed separately
+    if backend == "sentence-transformers":
+        return _load_sentence_transformer()
+    if backend in ONNX_FILES:
+        return _load_onnx(backend)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> List[str]:
+    # Needs torch and sentence-transformers once, on a build machine; the exported files then run without either
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+    sample = st_model.tokenizer(["Patient Name", "Individual Calendar Year Deductible"], padding=True, return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    model_file = os.path.join(output_dir, ONNX_FILES["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer), tuple(sample[name] for name in names), model_file,
+            input_names=names, output_names=["last_hidden_state"], opset_version=14,
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names},
+                          "last_hidden_state": {0: "batch", 1: "sequence"}}
+        )
+    st_model.tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({"model_name": model_name, "max_seq_length": st_model.max_seq_length}, f, indent=2)
+    written = [model_file]
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_file = os.path.join(output_dir, ONNX_FILES["onnx-int8"])
+        quantize_dynamic(model_file, int8_file, weight_type=QuantType.QInt8)
+        written.append(int8_file)
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model for the ONNX backends")
+    parser.add_argument("output", help="Directory to write model.onnx, model_int8.onnx and tokenizer files into")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+    for path in export_onnx(args.model, args.output, quantize=not args.no_quantize):
+        print(f"Wrote {path}")
+
+if __name__ == "__main__":
+    main()
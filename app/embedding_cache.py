@@ -0,0 +1,102 @@
+import sqlite3
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    def __init__(self, namespace: str, max_size: int = 10000, path: Optional[str] = None):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+            logger.info(f"Using on-disk embedding cache at {path}")
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE namespace = ? AND key IN ({placeholders})",
+                [self.namespace, *chunk]
+            ).fetchall()
+            for key, dim, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32, count=dim)
+        return found
+
+    def _store_on_disk(self, vectors: Dict[str, np.ndarray]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (namespace, key, dim, vector) VALUES (?, ?, ?, ?)",
+            [(self.namespace, key, int(v.shape[0]), np.asarray(v, dtype=np.float32).tobytes()) for key, v in vectors.items()]
+        )
+        self._db.commit()
+
+    def encode(self, keys: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        with self._lock:
+            found = {}
+            for key in dict.fromkeys(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.hits += len(found)
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            if missing and self._db is not None:
+                on_disk = self._load_from_disk(missing)
+                self.disk_hits += len(on_disk)
+                for key, vector in on_disk.items():
+                    found[key] = vector
+                    self._remember(key, vector)
+                missing = [key for key in missing if key not in on_disk]
+            self.misses += len(missing)
+
+        if missing:
+            logger.debug(f"Encoding {len(missing)} new raw keys")
+            encoded = np.asarray(encode_fn(missing), dtype=np.float32)
+            fresh = dict(zip(missing, encoded))
+            with self._lock:
+                for key, vector in fresh.items():
+                    self._remember(key, vector)
+                if self._db is not None:
+                    self._store_on_disk(fresh)
+            found.update(fresh)
+        return np.stack([found[key] for key in keys])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Higher runs first; popup requests are interactive, backfill scripts submit as bulk
+JOB_PRIORITIES = {"interactive": 10, "normal": 5, "bulk": 0}
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobQueue:
+    def __init__(self, path: str, lease: float = 300, max_attempts: int = 3, retention: float = 86400):
+        self.path = path
+        # A running job whose worker has not finished it within the lease is assumed lost and requeued
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.host = socket.gethostname()
+        # The nonce tells this process apart from an earlier one with the same pid, e.g. after a container restart
+        self.worker_id = f"{self.host}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, filename TEXT, "
+            "options TEXT NOT NULL, payload BLOB, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)")
+        logger.info(f"Using job queue at {path}")
+
+    def submit(self, filename: str, payload: bytes, options: Dict, priority: int = JOB_PRIORITIES["normal"]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, priority, filename, options, payload, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, priority, filename, json.dumps(options), payload, time.time())
+            )
+        return job_id
+
+    def claim(self) -> Optional[Dict]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes can never claim the same row
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, filename, options, payload, attempts FROM jobs WHERE status = 'queued' "
+                    "ORDER BY priority DESC, created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (self.worker_id, time.time(), row[0])
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "filename": row[1], "options": json.loads(row[2]), "payload": row[3], "attempts": row[4] + 1}
+
+    def complete(self, job_id: str, result) -> None:
+        self._finish(job_id, "done", result=json.dumps(result, separators=(",", ":")))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            # The upload is no longer needed once the job has an outcome
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, priority, filename, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            position = None
+            if row and row[1] == "queued":
+                position = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (row[2], row[2], row[7])
+                ).fetchone()[0]
+        if row is None:
+            return None
+        job = {
+            "id": row[0], "status": row[1], "priority": row[2], "filename": row[3], "attempts": row[6],
+            "created_at": row[7], "started_at": row[8], "finished_at": row[9]
+        }
+        if position is not None:
+            job["queue_position"] = position
+        if row[4] is not None:
+            job["data"] = json.loads(row[4])
+        if row[5] is not None:
+            job["error"] = row[5]
+        return job
+
+    def recover(self) -> int:
+        # Requeue jobs whose worker died mid-job: a dead pid on this host, or anyone's lease ran out
+        now = time.time()
+        requeued = 0
+        with self._lock:
+            rows = self._db.execute("SELECT id, worker, started_at, attempts FROM jobs WHERE status = 'running'").fetchall()
+            for job_id, worker, started_at, attempts in rows:
+                worker_host, _, rest = (worker or "").partition(":")
+                pid = rest.partition(":")[0]
+                lost = (started_at or 0) < now - self.lease
+                if worker_host == self.host and pid.isdigit() and worker != self.worker_id:
+                    # Our own pid under another worker id belonged to an earlier process that has since gone
+                    lost = lost or int(pid) == os.getpid() or not _pid_alive(int(pid))
+                if not lost:
+                    continue
+                if attempts >= self.max_attempts:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                        (f"Gave up after {attempts} attempts", now, job_id)
+                    )
+                else:
+                    self._db.execute("UPDATE jobs SET status = 'queued', worker = NULL WHERE id = ?", (job_id,))
+                    requeued += 1
+            if self.retention > 0:
+                self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                                 (now - self.retention,))
+        if requeued:
+            logger.warning(f"Requeued {requeued} jobs left running by a lost worker")
+        return requeued
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("queued", "running", "done", "failed")}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class JobWorkers:
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict], Dict], count: int = 2, poll_interval: float = 1.0,
+                 maintenance_interval: float = 60.0):
+        self.queue = queue
+        self.handler = handler
+        self.count = count
+        self.poll_interval = poll_interval
+        self.maintenance_interval = maintenance_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_maintenance = 0.0
+
+    def start(self) -> None:
+        self.queue.recover()
+        self._last_maintenance = time.monotonic()
+        for number in range(self.count):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_maintenance > self.maintenance_interval:
+                self._last_maintenance = time.monotonic()
+                try:
+                    self.queue.recover()
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to recover jobs: {e}")
+            # Clear before claiming, so a submit that lands in between still wakes us
+            self._wake.clear()
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to claim job: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                continue
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                logger.error(f"Job {job['id']} ({job['filename']}) failed: {str(e)}", exc_info=True)
+                self._record_outcome(job, error=f"Failed to process PDF: {str(e)}")
+            else:
+                self._record_outcome(job, result=result)
+
+    def _record_outcome(self, job: Dict, result=None, error: Optional[str] = None) -> None:
+        # A job whose outcome cannot be stored would otherwise sit in "running" until its lease runs out
+        if error is None:
+            try:
+                self.queue.complete(job["id"], result)
+                return
+            except Exception as e:
+                logger.error(f"Failed to store the result of job {job['id']}: {str(e)}", exc_info=True)
+                error = f"Failed to store result: {str(e)}"
+        try:
+            self.queue.fail(job["id"], error)
+        except Exception as e:
+            # Still running as far as the table knows; recover() requeues it once the lease expires
+            logger.error(f"Failed to mark job {job['id']} as failed: {str(e)}", exc_info=True)
@@ -0,0 +1,151 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+import concurrent.futures
+import httpx
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# How long a synchronous caller waits in total, queueing for a slot included
+LLM_WAIT_TIMEOUT = float(os.getenv("LLM_WAIT_TIMEOUT", str(LLM_TIMEOUT * 2)))
+
+class JsonObjectTracker:
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+
+    def feed(self, chunk: str) -> bool:
+        for char in chunk:
+            if self.complete:
+                break
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.started:
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+                self.started = True
+            elif char == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+        return self.complete
+
+class OllamaClient:
+    def __init__(self, base_url: str = OLLAMA_URL, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 pool_size: int = LLM_POOL_SIZE, timeout: float = LLM_TIMEOUT, wait_timeout: float = LLM_WAIT_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.wait_timeout = wait_timeout
+        self._forget_loop()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forget_loop)
+
+    def _forget_loop(self) -> None:
+        # A forked child (the process pipeline) inherits the loop but not the thread running it, nor a usable
+        # client; it starts over with its own. The lock is replaced too, in case the fork happened while it was held.
+        self._lock = threading.Lock()
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._pid = os.getpid()
+        self.in_flight = 0
+
+    def _ensure_async_state(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=5.0),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _generate(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        # Always runs on the background loop, which owns the client and the semaphore
+        self._ensure_async_state()
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await asyncio.wait_for(self._stream_generate(model, prompt, options or {}), self.timeout)
+            finally:
+                self.in_flight -= 1
+
+    async def _stream_generate(self, model: str, prompt: str, options: Dict) -> str:
+        payload = {"model": model, "prompt": prompt, "stream": True, "options": options}
+        tracker = JsonObjectTracker()
+        parts = []
+        async with self._client.stream("POST", "/api/generate", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                parts.append(token)
+                if tracker.feed(token):
+                    # Closing the stream early tells Ollama to stop generating
+                    logger.debug("Complete JSON object received, closing LLM stream early")
+                    break
+                if chunk.get("done"):
+                    break
+        return "".join(parts)
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        if self._pid != os.getpid():
+            self._forget_loop()
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run_loop, name="llm-client", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def generate_sync(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        # Worker threads share the background loop, so they share its connection pool and semaphore
+        future = asyncio.run_coroutine_threadsafe(self._generate(model, prompt, options), self._background_loop())
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise asyncio.TimeoutError(f"No LLM response within {self.wait_timeout}s")
+
+    async def generate(self, model: str, prompt: str, options: Optional[Dict] = None) -> str:
+        future = asyncio.run_coroutine_threadsafe(self._generate(model, prompt, options), self._background_loop())
+        return await asyncio.wrap_future(future)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self) -> None:
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+            self._thread = None
+
+llm_client = OllamaClient()
@@ -1,16 +1,66 @@
 import re
+import os
+import time
 import json
+import hashlib
+import bisect
+import difflib
 import logging
-from sentence_transformers import SentenceTransformer, util
-import requests
-from typing import Dict, List
+import threading
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import httpx
+from typing import Dict, List, Optional
+from embedding_cache import EmbeddingCache
+from model_provider import ModelProvider
+from carrier_templates import CarrierTemplates
+from result_cache import ResultCache
+from llm_client import llm_client
+from log_utils import LazyJson, configure_logging
+from metrics import timed_stage, RAW_KEYS, LLM_CALLS, FIELDS_FILLED, MATCH_TIERS
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 
-model = SentenceTransformer('all-MiniLM-L6-v2')
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# "sentence-transformers" (torch), or "onnx" / "onnx-int8" running a local export from EMBEDDING_MODEL_PATH
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+# Embeddings from different backends are close but not identical, so caches and saved indexes are kept apart
+EMBEDDING_ID = MODEL_NAME if EMBEDDING_BACKEND == "sentence-transformers" else f"{MODEL_NAME}:{EMBEDDING_BACKEND}"
+# Bump whenever mapping output changes so cached results are invalidated
+MAPPER_VERSION = "4"
+# Loaded on first use or by the service lifespan startup, see MODEL_PRELOAD in main.py
+model = ModelProvider(MODEL_NAME, EMBEDDING_BACKEND, EMBEDDING_MODEL_PATH)
 
 USE_LLM = True
+LLM_MODEL = os.getenv("LLM_MODEL", "phi")
+LLM_OPTIONS = {
+    "temperature": 0.3,
+    "num_ctx": 4096
+}
+VECTOR_MATCH_THRESHOLD = 0.6
+# Normalized-string similarity a raw key needs to match an alias in the fuzzy tier, before embeddings are tried
+FUZZY_MATCH_THRESHOLD = float(os.getenv("FUZZY_MATCH_THRESHOLD", "0.9"))
+ALIAS_INDEX_PATH = os.getenv("ALIAS_INDEX_PATH", "")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+
+# Learned per-layout plans persist here when set; pinned plans are hand-written JSON (see carrier_templates.py)
+CARRIER_TEMPLATES_PATH = os.getenv("CARRIER_TEMPLATES_PATH", "")
+CARRIER_TEMPLATES_PINNED = os.getenv("CARRIER_TEMPLATES_PINNED", "")
+TEMPLATE_MIN_OBSERVATIONS = int(os.getenv("TEMPLATE_MIN_OBSERVATIONS", "3"))
+
+raw_key_cache = EmbeddingCache(EMBEDDING_ID, max_size=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH or None)
+llm_cache = ResultCache("llm", max_size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL, path=LLM_CACHE_PATH or None)
+llm_call_stats = {"calls": 0, "call_seconds": 0.0, "calls_avoided": 0}
+_llm_stats_lock = threading.Lock()
 
 form_keys = {
     "patientName": ["Name", "Patient Name", "Subscriber"],
@@ -62,6 +112,102 @@ form_keys = {
     "preAuthRequired": ["Pretreatment review is available", "Predetermination", "Pre Auth Required"]
 }
 
+_alias_index = None
+
+def form_keys_signature() -> str:
+    payload = json.dumps({"model": EMBEDDING_ID, "form_keys": form_keys}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# MAPPER_VERSION is part of the version so plans learned by an older mapper are not reused
+carrier_templates = CarrierTemplates(f"{MAPPER_VERSION}:{form_keys_signature()}", CARRIER_TEMPLATES_PATH or None,
+                                     TEMPLATE_MIN_OBSERVATIONS)
+if CARRIER_TEMPLATES_PINNED:
+    carrier_templates.load_pinned(CARRIER_TEMPLATES_PINNED)
+
+def _flatten_form_keys() -> List[tuple]:
+    entries = []
+    for target, aliases in form_keys.items():
+        if isinstance(aliases, dict):
+            for sub_target, sub_aliases in aliases.items():
+                entries.extend((alias, target, sub_target) for alias in sub_aliases)
+        else:
+            entries.extend((alias, target, None) for alias in aliases)
+    return entries
+
+def build_alias_index() -> Dict:
+    entries = _flatten_form_keys()
+    aliases = [alias for alias, _, _ in entries]
+    embeddings = model.encode(aliases, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+    rows = {}
+    for i, (_, target, sub_target) in enumerate(entries):
+        rows.setdefault((target, sub_target), []).append(i)
+    logger.info("Built alias index: %s aliases for %s targets", len(aliases), len(rows))
+    return {
+        "signature": form_keys_signature(),
+        "aliases": aliases,
+        "targets": [(target, sub_target) for _, target, sub_target in entries],
+        "rows": rows,
+        "embeddings": np.asarray(embeddings, dtype=np.float32)
+    }
+
+def save_alias_index(index: Dict, path: str) -> None:
+    targets = np.array([[t, s or ""] for t, s in index["targets"]])
+    with open(path, "wb") as f:
+        np.savez(f, signature=np.array(index["signature"]), aliases=np.array(index["aliases"]),
+                 targets=targets, embeddings=index["embeddings"])
+    logger.info("Saved alias index to %s", path)
+
+def load_alias_index(path: str) -> Optional[Dict]:
+    try:
+        with np.load(path) as stored:
+            signature = str(stored["signature"])
+            if signature != form_keys_signature():
+                logger.info("Alias index at %s is stale, ignoring it", path)
+                return None
+            targets = [(str(t), str(s) or None) for t, s in stored["targets"]]
+            rows = {}
+            for i, target in enumerate(targets):
+                rows.setdefault(target, []).append(i)
+            return {
+                "signature": signature,
+                "aliases": [str(a) for a in stored["aliases"]],
+                "targets": targets,
+                "rows": rows,
+                "embeddings": np.asarray(stored["embeddings"], dtype=np.float32)
+            }
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Failed to load alias index from {path}: {e}")
+        return None
+
+def get_alias_index() -> Dict:
+    global _alias_index
+    if _alias_index is None or _alias_index["signature"] != form_keys_signature():
+        _alias_index = build_alias_index()
+    return _alias_index
+
+def alias_index_loaded() -> bool:
+    return _alias_index is not None and _alias_index["signature"] == form_keys_signature()
+
+def warm_alias_index(path: str = ALIAS_INDEX_PATH, build: bool = True) -> Optional[Dict]:
+    global _alias_index
+    if path:
+        index = load_alias_index(path)
+        if index is not None:
+            logger.info("Loaded alias index from %s", path)
+            _alias_index = index
+            return index
+    if not build:
+        return None
+    index = get_alias_index()
+    if path:
+        try:
+            save_alias_index(index, path)
+        except OSError as e:
+            logger.warning(f"Failed to save alias index to {path}: {e}")
+    return index
+
 def extract_json_from_llm(text: str) -> dict:
     try:
         text = re.sub(r'```json\n|```', '', text).strip()
@@ -81,7 +227,7 @@ def extract_json_from_llm(text: str) -> dict:
         if not isinstance(parsed_json, dict):
             logger.error("Parsed LLM response is not a dictionary.")
             return {}
-        logger.debug(f"Parsed LLM JSON: {parsed_json}")
+        logger.debug("Parsed LLM JSON: %s", parsed_json)
         return parsed_json
     except json.JSONDecodeError as e:
         logger.error(f"JSON Decode Error: {e}\nText: {text[:100]}...")
@@ -90,170 +236,397 @@ def extract_json_from_llm(text: str) -> dict:
         logger.error(f"Unexpected error parsing JSON: {e}")
         return {}
 
-def map_fields_with_vectors(raw_data: Dict) -> Dict:
-    mapped = {
+def score_alias_matches(raw_keys: List[str], raw_embeddings: np.ndarray) -> Dict[tuple, tuple]:
+    index = get_alias_index()
+    # (aliases x raw keys) cosine similarities; both sides are L2-normalized
+    scores = index["embeddings"] @ np.asarray(raw_embeddings, dtype=np.float32).T
+    alias_best = scores.argmax(axis=1)
+    alias_scores = scores[np.arange(scores.shape[0]), alias_best]
+    best = {}
+    for target, rows in index["rows"].items():
+        # First alias wins ties, matching the order of the old nested loops
+        winner = rows[int(alias_scores[rows].argmax())]
+        best[target] = (raw_keys[int(alias_best[winner])], float(alias_scores[winner]))
+    return best
+
+LABEL_ABBREVIATIONS = {
+    "max": "maximum", "ded": "deductible", "indiv": "individual", "ind": "individual", "fam": "family",
+    "cal": "calendar", "yr": "year", "xrays": "x rays", "#": "number", "&": "and"
+}
+_LABEL_TOKEN_RE = re.compile(r"[a-z0-9]+|[#&]")
+# "D0120 - Periodic oral evaluation": procedure code entries, never a form field
+_PROCEDURE_LABEL_RE = re.compile(r"^d\d{4}\b")
+_alias_lookup = None
+
+def normalize_label(label: str) -> str:
+    # Case, punctuation and common abbreviations ("Max." vs "Maximum", "Account #") do not change a label
+    return " ".join(LABEL_ABBREVIATIONS.get(token, token) for token in _LABEL_TOKEN_RE.findall(label.lower()))
+
+def get_alias_lookup() -> Dict:
+    global _alias_lookup
+    signature = form_keys_signature()
+    if _alias_lookup is None or _alias_lookup["signature"] != signature:
+        exact = {}
+        by_target = {}
+        for rank, (alias, target, sub_target) in enumerate(_flatten_form_keys()):
+            normalized = normalize_label(alias)
+            exact.setdefault(normalized, []).append(((target, sub_target), rank))
+            by_target.setdefault((target, sub_target), []).append(normalized)
+        _alias_lookup = {"signature": signature, "exact": exact, "by_target": by_target}
+    return _alias_lookup
+
+def fuzzy_matches(lookup: Dict, targets: List[tuple], keys: List[str], normalized: Dict[str, str],
+                  threshold: float) -> Dict[tuple, tuple]:
+    # Best (key, score) per target. One matcher per key: SequenceMatcher caches its work on the second sequence.
+    top = {}
+    matcher = difflib.SequenceMatcher(None)
+    aliases = sorted((len(alias), target, alias_rank, alias)
+                     for target in targets for alias_rank, alias in enumerate(lookup["by_target"][target]))
+    lengths = [alias_length for alias_length, _, _, _ in aliases]
+    for key_rank, key in enumerate(keys):
+        label = normalized[key]
+        length = len(label)
+        if not length:
+            continue
+        # ratio() can never beat 2 * shorter / total, so only aliases of a similar length are compared at all
+        low = bisect.bisect_left(lengths, length * threshold / (2 - threshold) - 1e-9)
+        high = bisect.bisect_right(lengths, length * (2 - threshold) / threshold + 1e-9) if threshold > 0 else len(lengths)
+        if low >= high:
+            continue
+        matcher.set_seq2(label)
+        for alias_length, target, alias_rank, alias in aliases[low:high]:
+            matcher.set_seq1(alias)
+            if matcher.quick_ratio() < threshold:
+                continue
+            score = matcher.ratio()
+            if score < threshold:
+                continue
+            # Highest score wins, then the earliest alias, then the earliest raw key
+            rank = (-score, alias_rank, key_rank)
+            if target not in top or rank < top[target][0]:
+                top[target] = (rank, key, score)
+    return {target: (key, score) for target, (_, key, score) in top.items()}
+
+def match_cheap_tiers(raw_keys: List[str]) -> tuple:
+    # Exact normalized-alias hits, then fuzzy string matches; returns the matches and the raw keys left for embeddings
+    lookup = get_alias_lookup()
+    normalized = {key: normalize_label(key) for key in raw_keys}
+    best = {}
+    ranks = {}
+    for key in raw_keys:
+        for target, rank in lookup["exact"].get(normalized[key], ()):
+            # Earliest alias wins, then earliest raw key, as in the embedding tier
+            if target not in ranks or rank < ranks[target]:
+                ranks[target] = rank
+                best[target] = (key, 1.0, "exact")
+    # Targets may share a raw key, so every key stays a candidate; only resolved targets drop out
+    candidates = [key for key in raw_keys if not _PROCEDURE_LABEL_RE.match(normalized[key])]
+    unresolved = [target for target in lookup["by_target"] if target not in best]
+    for target, (key, score) in fuzzy_matches(lookup, unresolved, candidates, normalized, FUZZY_MATCH_THRESHOLD).items():
+        best[target] = (key, score, "fuzzy")
+    unresolved = [target for target in unresolved if target not in best]
+    return best, candidates if unresolved else []
+
+def match_embedding_tier(best: Dict[tuple, tuple], candidates: List[str], candidate_embeddings: np.ndarray) -> Dict[tuple, tuple]:
+    for target, (match, score) in score_alias_matches(candidates, candidate_embeddings).items():
+        if target not in best:
+            best[target] = (match, score, "embedding")
+    return best
+
+def apply_alias_matches(raw_data: Dict, best: Dict[tuple, tuple]) -> tuple:
+    mapped = _empty_vector_mapping()
+    scores = {}
+    for target, aliases in form_keys.items():
+        if target in ["coinsurance", "frequencies"]:
+            for sub_target in aliases:
+                best_match, best_score, tier = best.get((target, sub_target), (None, -1.0, None))
+                if best_score > VECTOR_MATCH_THRESHOLD and best_match in raw_data:
+                    mapped[target][sub_target] = raw_data[best_match]
+                    scores[f"{target}.{sub_target}"] = {"match": best_match, "score": best_score, "tier": tier}
+                    MATCH_TIERS.inc(tier=tier)
+                    logger.debug("Mapped %s.%s to %s (score: %s, tier: %s)", target, sub_target, best_match, best_score, tier)
+        else:
+            best_match, best_score, tier = best.get((target, None), (None, -1.0, None))
+            if best_score > VECTOR_MATCH_THRESHOLD and best_match in raw_data:
+                mapped[target] = raw_data[best_match]
+                scores[target] = {"match": best_match, "score": best_score, "tier": tier}
+                MATCH_TIERS.inc(tier=tier)
+                logger.debug("Mapped %s to %s (score: %s, tier: %s)", target, best_match, best_score, tier)
+            else:
+                mapped[target] = ""
+    return mapped, scores
+
+def _encode_with_model(keys: List[str]) -> np.ndarray:
+    return model.encode(keys, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+@timed_stage("encode")
+def encode_raw_keys(raw_keys: List[str]) -> np.ndarray:
+    return raw_key_cache.encode(raw_keys, _encode_with_model)
+
+def _empty_vector_mapping() -> Dict:
+    return {
         "coinsurance": {},
         "frequencies": {}
     }
+
+@timed_stage("map_vectors")
+def map_fields_with_vectors(raw_data: Dict, return_scores: bool = False):
     raw_keys = list(raw_data.keys())
     if not raw_keys:
         logger.warning("No raw keys found for vector mapping")
-        return mapped
+        mapped = _empty_vector_mapping()
+        return (mapped, {}) if return_scores else mapped
 
-    raw_embeddings = model.encode(raw_keys)
+    RAW_KEYS.observe(len(raw_keys))
+    best, candidates = match_cheap_tiers(raw_keys)
+    if candidates:
+        match_embedding_tier(best, candidates, encode_raw_keys(candidates))
+    mapped, scores = apply_alias_matches(raw_data, best)
 
-    for target, aliases in form_keys.items():
-        if target in ["coinsurance", "frequencies"]:
+    logger.debug("Vector mapping result: %s", LazyJson(mapped))
+    return (mapped, scores) if return_scores else mapped
+
+LLM_PROMPT_HEADER = """You are an assistant that extracts field values from insurance raw data.
+Return a JSON object mapping the provided data to the specified fields. Only include fields with non-empty values. Use exact values from the data without modification."""
+
+LLM_FIELD_INSTRUCTIONS = {
+    "patientName": "Ensure 'patientName' is extracted as a proper name (e.g., 'Jazmin Angel'), not an ID.",
+    "familyMaximum": "For 'familyMaximum', extract a dollar amount from 'Total', 'Plan Details', related fields or raw_data.benefits.maximum.family.",
+    "individualMaximum": "For 'individualMaximum', extract a dollar amount from 'Total', 'Plan Details', related fields or raw_data.benefits.maximum.individual.",
+    "familyDeductible": "For 'familyDeductible', extract a dollar amount from 'Total', 'Plan Details', related fields or raw_data.benefits.deductible.family.",
+    "individualDeductible": "For 'individualDeductible', extract a dollar amount from 'Total', 'Plan Details', related fields or raw_data.benefits.deductible.individual.",
+    "familyMaxRemaining": "For 'familyMaxRemaining', extract a dollar amount from related fields or raw_data.benefits.maximum.family_remaining.",
+    "individualMaxRemaining": "For 'individualMaxRemaining', extract a dollar amount from related fields or raw_data.benefits.maximum.individual_remaining.",
+    "familyDeductibleRemaining": "For 'familyDeductibleRemaining', extract a dollar amount from related fields or raw_data.benefits.deductible.family_remaining.",
+    "individualDeductibleRemaining": "For 'individualDeductibleRemaining', extract a dollar amount from related fields or raw_data.benefits.deductible.individual_remaining.",
+    "benefitsCoordinationMethod": "Map 'benefitsCoordinationMethod' to 'No' if 'Other Insurance?: No' is present.",
+    "preAuthRequired": "Extract the full 'Pretreatment review' or 'Predetermination' text for 'preAuthRequired' exactly as it appears.",
+    "insuranceType": "For 'insuranceType', use the simplified plan type (e.g., 'PPO' from 'DENTAL PPO') if available.",
+    "coinsurance": "Structure 'coinsurance' as a nested object.",
+    "frequencies": "Structure 'frequencies' as a nested object."
+}
+
+LLM_EXAMPLE_OUTPUT = {
+    "subscriberId": "U93162774 01",
+    "effectiveDate": "10/01/2024",
+    "terminationDate": "Present",
+    "payorName": "DELI MANAGEMENT, INC. DBA JASON'S DELI",
+    "patientName": "Jazmi Angel",
+    "subscriberDateOfBirth": "01/26/2001",
+    "gender": "Female",
+    "subscriberRelationship": "Self",
+    "planName": "DENTAL PPO",
+    "groupNumber": "3327706",
+    "insuranceType": "PPO",
+    "employer": "DELI MANAGEMENT, INC.",
+    "planResetDate": "",
+    "planType": "DENTAL PPO",
+    "benefitsCoordinationMethod": "No",
+    "verifiedDate": "",
+    "participationType": "",
+    "familyMaximum": "$1,500.00",
+    "familyMaxRemaining": "$1,500.00",
+    "individualMaximum": "$2,500.00",
+    "individualMaxRemaining": "$2,200.00",
+    "familyDeductible": "$150.00",
+    "familyDeductibleRemaining": "$50.00",
+    "individualDeductible": "$50.00",
+    "individualDeductibleRemaining": "$0.00",
+    "coinsurance": {
+        "diagnostic": "0%",
+        "basicRestorative": "20%",
+        "majorRestorative": "50%",
+        "orthodontics": "50%"
+    },
+    "frequencies": {
+        "oralExam": "Twice Per Calendar Year",
+        "fullMouthXRays": "Once Every 3 Years",
+        "bitewingXRays": "Once Per Calendar Year",
+        "adultCleaning": "Twice Per Calendar Year",
+        "topicalFluoride": "Twice Per Calendar Year",
+        "topicalSealant": "Once Per Year",
+        "crown": "Once Per 60 Consecutive Months",
+        "bridgeWork": "Once Per 60 Consecutive Months"
+    },
+    "preAuthRequired": "Pretreatment review is available on a voluntary basis when dental work in excess of $200 is proposed by the provider."
+}
+
+PROMPT_STOPWORDS = {"of", "and", "the", "to", "is", "no", "x", "a", "on", "in", "per"}
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text and compact JSON
+    return (len(text) + 3) // 4
+
+def _compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def _tokens(text: str) -> set:
+    words = re.findall(r"[a-z0-9]+", re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text)).lower())
+    return {w for w in words if w not in PROMPT_STOPWORDS}
+
+def _field_vocabulary(fields: List[str]) -> set:
+    vocabulary = set()
+    for field in fields:
+        vocabulary |= _tokens(field)
+        aliases = form_keys.get(field, [])
+        if isinstance(aliases, dict):
             for sub_target, sub_aliases in aliases.items():
-                alias_embeddings = model.encode(sub_aliases)
-                best_score, best_match = -1, None
-                for alias_emb in alias_embeddings:
-                    for i, raw_emb in enumerate(raw_embeddings):
-                        score = util.cos_sim(alias_emb, raw_emb).item()
-                        if score > best_score:
-                            best_score = score
-                            best_match = raw_keys[i]
-                threshold = 0.6
-                if best_score > threshold and best_match in raw_data:
-                    mapped[target][sub_target] = raw_data[best_match]
-                    logger.debug(f"Mapped {target}.{sub_target} to {best_match} (score: {best_score})")
+                vocabulary |= _tokens(sub_target)
+                for alias in sub_aliases:
+                    vocabulary |= _tokens(alias)
         else:
-            alias_embeddings = model.encode(aliases)
-            best_score, best_match = -1, None
-            for alias_emb in alias_embeddings:
-                for i, raw_emb in enumerate(raw_embeddings):
-                    score = util.cos_sim(alias_emb, raw_emb).item()
-                    if score > best_score:
-                        best_score = score
-                        best_match = raw_keys[i]
-            threshold = 0.6
-            if best_score > threshold and best_match in raw_data:
-                mapped[target] = raw_data[best_match]
-                logger.debug(f"Mapped {target} to {best_match} (score: {best_score})")
-            else:
-                mapped[target] = ""
+            for alias in aliases:
+                vocabulary |= _tokens(alias)
+    return vocabulary
 
-    logger.debug(f"Vector mapping result: {json.dumps(mapped, indent=2)}")
-    return mapped
+def _relevant_raw_data(raw_data: Dict, vocabulary: set) -> Dict:
+    relevant = {}
+    for key, value in raw_data.items():
+        if _tokens(key) & vocabulary:
+            relevant[key] = value
+        elif isinstance(value, dict):
+            nested = _relevant_raw_data(value, vocabulary)
+            if nested:
+                relevant[key] = nested
+        elif isinstance(value, str) and len(value) < 300 and _tokens(value) & vocabulary:
+            relevant[key] = value
+    return relevant
+
+def _simplify_tables(tables: List[Dict], vocabulary: Optional[set] = None) -> List[List[Dict]]:
+    simplified_tables = []
+    for table in tables:
+        simplified = []
+        for row in table:
+            row_data = {k: v for k, v in row.items() if k and v and len(str(v)) < 50}
+            if row_data and (vocabulary is None or _tokens(" ".join(map(str, row_data.values()))) & vocabulary):
+                simplified.append(row_data)
+        if simplified:
+            simplified_tables.append(simplified)
+        if len(simplified_tables) == 3:
+            break
+    return simplified_tables
+
+def llm_prompt_inputs(raw_data: Dict, tables: List[Dict], missing_fields: Optional[List[str]] = None) -> tuple:
+    fields = [f for f in (missing_fields or list(form_keys.keys())) if f in form_keys]
+    vocabulary = _field_vocabulary(fields)
+    relevant_raw = _relevant_raw_data(raw_data, vocabulary) if missing_fields else raw_data
+    simplified_tables = _simplify_tables(tables, vocabulary if missing_fields else None)
+    return fields, relevant_raw, simplified_tables
+
+def llm_cache_key(fields: List[str], relevant_raw: Dict, simplified_tables: List[List[Dict]]) -> str:
+    payload = json.dumps({
+        "model": LLM_MODEL,
+        "options": LLM_OPTIONS,
+        "fields": sorted(fields),
+        "raw": relevant_raw,
+        "tables": simplified_tables,
+        "form_keys": form_keys_signature()
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-def map_fields_with_llm(raw_data: Dict, tables: List[Dict]) -> Dict:
+def build_llm_prompt(raw_data: Dict, tables: List[Dict], missing_fields: Optional[List[str]] = None, inputs: Optional[tuple] = None) -> tuple:
+    fields, relevant_raw, simplified_tables = inputs or llm_prompt_inputs(raw_data, tables, missing_fields)
+    instructions = [LLM_FIELD_INSTRUCTIONS[f] for f in fields if f in LLM_FIELD_INSTRUCTIONS]
+    prompt = "\n".join([
+        LLM_PROMPT_HEADER,
+        *instructions,
+        "",
+        "Raw Data:",
+        _compact_json(relevant_raw),
+        "",
+        "Tables:",
+        _compact_json(simplified_tables),
+        "",
+        "Map to these fields:",
+        _compact_json({f: form_keys[f] for f in fields}),
+        "",
+        "Example output:",
+        _compact_json({f: LLM_EXAMPLE_OUTPUT[f] for f in fields if f in LLM_EXAMPLE_OUTPUT}),
+        ""
+    ])
+    stats = {
+        "fields": len(fields),
+        "raw_keys": len(relevant_raw),
+        "tables": len(simplified_tables),
+        "prompt_chars": len(prompt),
+        "prompt_tokens_est": estimate_tokens(prompt)
+    }
+    return prompt, stats
+
+def llm_cache_stats() -> Dict:
+    stats = llm_cache.stats()
+    with _llm_stats_lock:
+        calls = llm_call_stats["calls"]
+        avg_seconds = llm_call_stats["call_seconds"] / calls if calls else 0.0
+        stats.update({
+            "llm_calls": calls,
+            "calls_avoided": llm_call_stats["calls_avoided"],
+            "avg_call_seconds": round(avg_seconds, 3),
+            "estimated_seconds_saved": round(avg_seconds * llm_call_stats["calls_avoided"], 3)
+        })
+    return stats
+
+@timed_stage("map_llm")
+def map_fields_with_llm(raw_data: Dict, tables: List[Dict], missing_fields: Optional[List[str]] = None) -> Dict:
     if not USE_LLM:
         logger.info("Skipping LLM mapping (USE_LLM = False)")
         return {}
 
     try:
-        simplified_tables = []
-        for table in tables[:3]:
-            simplified = []
-            for row in table:
-                row_data = {k: v for k, v in row.items() if k and v and len(str(v)) < 50}
-                if row_data:
-                    simplified.append(row_data)
-            if simplified:
-                simplified_tables.append(simplified)
-
-        prompt = f"""You are an assistant that extracts field values from insurance raw data.
-Return a JSON object mapping the provided data to the specified fields. Only include fields with non-empty values. Structure coinsurance and frequencies as nested objects. Ensure 'patientName' is extracted as a proper name (e.g., 'Jazmin Angel'), not an ID. Use exact values from the data without modification. For 'familyMaximum', 'individualMaximum', 'familyDeductible', and 'individualDeductible', extract dollar amounts (e.g., '$1,500.00', '$50.00') from 'Total', 'Plan Details', or related fields, or from raw_data.benefits.maximum.family, raw_data.benefits.maximum.individual, raw_data.benefits.deductible.family, raw_data.benefits.deductible.individual if available. For 'familyMaxRemaining', 'individualMaxRemaining', 'familyDeductibleRemaining', and 'individualDeductibleRemaining', extract dollar amounts from bold text, related fields, or from raw_data.benefits.maximum.family_remaining, raw_data.benefits.maximum.individual_remaining, raw_data.benefits.deductible.family_remaining, raw_data.benefits.deductible.individual_remaining if available. Map 'benefitsCoordinationMethod' to 'No' if 'Other Insurance?: No' is present. Extract the full 'Pretreatment review' or 'Predetermination' text for 'preAuthRequired' exactly as it appears. For 'insuranceType', use the simplified plan type (e.g., 'PPO' from 'DENTAL PPO') if available.
-
-Raw Data:
-{json.dumps(raw_data, indent=2)}
-
-Tables:
-{json.dumps(simplified_tables, indent=2)}
-
-Map to these fields:
-{json.dumps(form_keys, indent=2)}
-
-Example output:
-{{
-  "subscriberId": "U93162774 01",
-  "effectiveDate": "10/01/2024",
-  "terminationDate": "Present",
-  "payorName": "DELI MANAGEMENT, INC. DBA JASON'S DELI",
-  "patientName": "Jazmi Angel",
-  "subscriberDateOfBirth": "01/26/2001",
-  "gender": "Female",
-  "subscriberRelationship": "Self",
-  "planName": "DENTAL PPO",
-  "groupNumber": "3327706",
-  "insuranceType": "PPO",
-  "employer": "DELI MANAGEMENT, INC.",
-  "planResetDate": "",
-  "planType": "DENTAL PPO",
-  "benefitsCoordinationMethod": "No",
-  "verifiedDate": "",
-  "participationType": "",
-  "familyMaximum": "$1,500.00",
-  "familyMaxRemaining": "$1,500.00",
-  "individualMaximum": "$2,500.00",
-  "individualMaxRemaining": "$2,200.00",
-  "familyDeductible": "$150.00",
-  "familyDeductibleRemaining": "$50.00",
-  "individualDeductible": "$50.00",
-  "individualDeductibleRemaining": "$0.00",
-  "coinsurance": {{
-    "diagnostic": "0%",
-    "basicRestorative": "20%",
-    "majorRestorative": "50%",
-    "orthodontics": "50%"
-  }},
-  "frequencies": {{
-    "oralExam": "Twice Per Calendar Year",
-    "fullMouthXRays": "Once Every 3 Years",
-    "bitewingXRays": "Once Per Calendar Year",
-    "adultCleaning": "Twice Per Calendar Year",
-    "topicalFluoride": "Twice Per Calendar Year",
-    "topicalSealant": "Once Per Year",
-    "crown": "Once Per 60 Consecutive Months",
-    "bridgeWork": "Once Per 60 Consecutive Months"
-  }},
-  "preAuthRequired": "Pretreatment review is available on a voluntary basis when dental work in excess of $200 is proposed by the provider."
-}}
-"""
-        logger.info("Sending prompt to LLM")
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": "phi",
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.3,
-                    "num_ctx": 4096
-                }
-            },
-            timeout=60
-        )
-        response.raise_for_status()
-        raw_response = response.json().get("response", "").strip()
-        logger.debug(f"Raw LLM response: {raw_response[:200]}...")
+        inputs = llm_prompt_inputs(raw_data, tables, missing_fields)
+        cache_key = llm_cache_key(*inputs)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            with _llm_stats_lock:
+                llm_call_stats["calls_avoided"] += 1
+            logger.info("Using cached LLM mapping result")
+            LLM_CALLS.inc(outcome="cached")
+            return cached
+
+        prompt, stats = build_llm_prompt(raw_data, tables, missing_fields, inputs=inputs)
+        logger.info("Sending prompt to LLM: %s fields, ~%s tokens", stats['fields'], stats['prompt_tokens_est'])
+        start = time.perf_counter()
+        raw_response = llm_client.generate_sync(LLM_MODEL, prompt, LLM_OPTIONS).strip()
+        with _llm_stats_lock:
+            llm_call_stats["calls"] += 1
+            llm_call_stats["call_seconds"] += time.perf_counter() - start
+        LLM_CALLS.inc(outcome="called")
+        logger.debug("Raw LLM response: %s...", raw_response[:200])
         parsed_response = extract_json_from_llm(raw_response)
-        logger.debug(f"LLM mapping result: {json.dumps(parsed_response, indent=2)}")
+        logger.debug("LLM mapping result: %s", LazyJson(parsed_response))
+        if parsed_response:
+            llm_cache.set(cache_key, parsed_response)
         return parsed_response
-    except requests.RequestException as e:
-        logger.error(f"LLM API request failed: {e}")
+    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+        logger.error(f"LLM API request failed: {e!r}")
+        LLM_CALLS.inc(outcome="error")
         return {}
     except Exception as e:
         logger.error(f"LLM Mapping failed: {e}", exc_info=True)
+        LLM_CALLS.inc(outcome="error")
         return {}
 
-def hybrid_field_mapper(raw_data: Dict, tables: List[Dict]) -> Dict:
-    logger.info("Starting hybrid field mapping")
-    logger.debug(f"Raw data: {json.dumps(raw_data, indent=2)}")
-    logger.debug(f"Tables: {json.dumps(tables, indent=2)}")
-    mapped = map_fields_with_vectors(raw_data)
-
+def complete_mapping(mapped: Dict, raw_data: Dict, tables: List[Dict]) -> tuple:
+    # Returns the cleaned mapping and whether the LLM actually answered for the missing fields
+    missing_fields = [k for k, v in mapped.items() if not v or (isinstance(v, dict) and not any(v.values()))]
+    FIELDS_FILLED.inc(len(mapped) - len(missing_fields), source="vectors")
+    llm_answered = False
     if USE_LLM:
-        missing_fields = [k for k, v in mapped.items() if not v or (isinstance(v, dict) and not any(v.values()))]
-        logger.debug(f"Missing fields before LLM mapping: {missing_fields}")
+        logger.debug("Missing fields before LLM mapping: %s", missing_fields)
         if missing_fields:
-            logger.info(f"Missing fields for LLM mapping: {missing_fields}")
-            llm_result = map_fields_with_llm(raw_data, tables)
+            logger.info("Missing fields for LLM mapping: %s", missing_fields)
+            llm_result = map_fields_with_llm(raw_data, tables, missing_fields)
+            # An empty result is what a failed, timed-out or unparseable call returns too
+            llm_answered = bool(llm_result)
             for field in missing_fields:
                 if field in llm_result:
                     mapped[field] = llm_result[field]
-                    logger.debug(f"LLM filled field {field}: {mapped[field]}")
+                    FIELDS_FILLED.inc(source="llm")
+                    logger.debug("LLM filled field %s: %s", field, mapped[field])
 
+    return clean_mapping(mapped), llm_answered
+
+def clean_mapping(mapped: Dict) -> Dict:
     for key, value in mapped.items():
         if isinstance(value, str):
             mapped[key] = value.strip()
@@ -265,5 +638,122 @@ def hybrid_field_mapper(raw_data: Dict, tables: List[Dict]) -> Dict:
                     value[sub_key] = sub_value.strip()
                     if "N/A" in sub_value or not sub_value:
                         value[sub_key] = ""
-    logger.debug(f"Final mapped data: {json.dumps(mapped, indent=2)}")
-    return mapped
\ No newline at end of file
+    logger.debug("Final mapped data: %s", LazyJson(mapped))
+    return mapped
+
+def _field_value(mapped: Dict, field: str):
+    target, _, sub_target = field.partition(".")
+    value = mapped.get(target)
+    if sub_target:
+        return value.get(sub_target) if isinstance(value, dict) else None
+    return value
+
+def apply_template(raw_data: Dict, plan: Dict[str, str]) -> tuple:
+    # Same shape as apply_alias_matches; returns the fields the plan could not fill from this document
+    mapped = _empty_vector_mapping()
+    missing = []
+    for target, aliases in form_keys.items():
+        fields = [(f"{target}.{sub_target}", sub_target) for sub_target in aliases] if isinstance(aliases, dict) else [(target, None)]
+        for field, sub_target in fields:
+            raw_key = plan.get(field)
+            # An empty raw key means this layout never carries the field, so there is nothing to fall back for
+            value = raw_data.get(raw_key) if raw_key else None
+            if raw_key is None or (raw_key and not value):
+                missing.append(field)
+            if sub_target is None:
+                mapped[target] = value or ""
+            elif value:
+                mapped[target][sub_target] = value
+    return mapped, missing
+
+def template_observations(scores: Dict, final: Dict, llm_answered: bool) -> Dict[str, str]:
+    observations = {field: match["match"] for field, match in scores.items()}
+    if not llm_answered:
+        # Without an LLM answer an empty field proves nothing; recording it would stop the LLM being asked again
+        return observations
+    for target, aliases in form_keys.items():
+        fields = [f"{target}.{sub_target}" for sub_target in aliases] if isinstance(aliases, dict) else [target]
+        for field in fields:
+            # Still empty after vectors and the LLM: this layout does not have the field
+            if field not in observations and not _field_value(final, field):
+                observations[field] = ""
+    return observations
+
+def map_document(raw_data: Dict, tables: List[Dict], fingerprint: Optional[str], vector_mapping,
+                 templated: Optional[tuple] = None) -> Dict:
+    plan = carrier_templates.plan_for(fingerprint)
+    if plan:
+        template_mapped, missing = templated or apply_template(raw_data, plan)
+        if not missing:
+            # Known layout and every field found: no embeddings, no LLM
+            carrier_templates.record("full")
+            FIELDS_FILLED.inc(sum(1 for value in template_mapped.values() if value), source="template")
+            logger.info("Mapped fields from carrier template %s", fingerprint)
+            return clean_mapping(template_mapped)
+        carrier_templates.record("partial")
+        logger.info("Carrier template %s missed %s fields, falling back for them", fingerprint, len(missing))
+    elif fingerprint:
+        carrier_templates.record("miss")
+    mapped, scores = vector_mapping()
+    if plan:
+        for field in missing:
+            target, _, sub_target = field.partition(".")
+            if sub_target:
+                if sub_target in mapped[target]:
+                    template_mapped[target][sub_target] = mapped[target][sub_target]
+            else:
+                template_mapped[target] = mapped[target]
+        mapped = template_mapped
+    result, llm_answered = complete_mapping(mapped, raw_data, tables)
+    carrier_templates.observe(fingerprint, template_observations(scores, result, llm_answered))
+    return result
+
+def hybrid_field_mapper(raw_data: Dict, tables: List[Dict], fingerprint: Optional[str] = None) -> Dict:
+    logger.info("Starting hybrid field mapping")
+    logger.debug("Raw data: %s", LazyJson(raw_data))
+    logger.debug("Tables: %s", LazyJson(tables))
+    return map_document(raw_data, tables, fingerprint, lambda: map_fields_with_vectors(raw_data, return_scores=True))
+
+def hybrid_field_mapper_batch(list_of_raw_data: List[Dict], list_of_tables: List[List[Dict]],
+                              fingerprints: Optional[List[Optional[str]]] = None) -> List[Dict]:
+    if len(list_of_raw_data) != len(list_of_tables):
+        raise ValueError("list_of_raw_data and list_of_tables must have the same length")
+    fingerprints = fingerprints or [None] * len(list_of_raw_data)
+    logger.info("Starting batch field mapping for %s documents", len(list_of_raw_data))
+    templated = []
+    for raw_data, fingerprint in zip(list_of_raw_data, fingerprints):
+        plan = carrier_templates.plan_for(fingerprint)
+        templated.append(apply_template(raw_data, plan) if plan else None)
+    # Exact and fuzzy tiers first; then every key still unresolved anywhere in the batch is encoded once
+    cheap = {}
+    for i, (raw_data, done) in enumerate(zip(list_of_raw_data, templated)):
+        if (done is None or done[1]) and raw_data:
+            cheap[i] = match_cheap_tiers(list(raw_data.keys()))
+    unique_keys = list(dict.fromkeys(key for _, candidates in cheap.values() for key in candidates))
+    key_rows = {key: i for i, key in enumerate(unique_keys)}
+    embeddings = encode_raw_keys(unique_keys) if unique_keys else None
+    total_keys = sum(len(raw_data) for raw_data in list_of_raw_data)
+    logger.info("Encoded %s unique raw keys out of %s", len(unique_keys), total_keys)
+
+    def vector_mapping(i: int, raw_data: Dict) -> tuple:
+        RAW_KEYS.observe(len(raw_data))
+        if not raw_data:
+            logger.warning("No raw keys found for vector mapping")
+            return _empty_vector_mapping(), {}
+        best, candidates = cheap[i]
+        if candidates:
+            match_embedding_tier(best, candidates, embeddings[[key_rows[key] for key in candidates]])
+        return apply_alias_matches(raw_data, best)
+
+    def map_one(i: int) -> Dict:
+        raw_data = list_of_raw_data[i]
+        return map_document(raw_data, list_of_tables[i], fingerprints[i], lambda: vector_mapping(i, raw_data), templated[i])
+
+    # Embeddings are shared above; the LLM fallback is per document, so those calls overlap as they do on the
+    # per-file path (llm_client still caps them at LLM_MAX_CONCURRENCY)
+    workers = min(len(list_of_raw_data), max(1, llm_client.max_concurrency)) if USE_LLM else 1
+    if workers <= 1:
+        return [map_one(i) for i in range(len(list_of_raw_data))]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-map") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, map_one, i) for i in range(len(list_of_raw_data))]
+        return [future.result() for future in futures]
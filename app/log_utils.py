@@ -0,0 +1,57 @@
+import os
+import json
+import random
+import logging
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" keeps the default basicConfig output; "json" emits one structured object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Fraction of DEBUG/INFO records kept; warnings and errors are never sampled out
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+_configured = False
+
+class LazyJson:
+    # Defers json.dumps until a handler actually formats the record
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value, indent: int = 2):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+def configure_logging() -> None:
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    logging.basicConfig(level=LOG_LEVEL)
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if LOG_FORMAT == "json":
+            handler.setFormatter(JsonFormatter())
+        if LOG_SAMPLE_RATE < 1.0:
+            handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
@@ -1,16 +1,32 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-import tempfile
-import json
+from fastapi.responses import StreamingResponse, ORJSONResponse, PlainTextResponse
+import orjson
 import logging
-from typing import Dict
-from pdf_parser import parse_pdf
-from llm_mapper import hybrid_field_mapper
+from typing import Dict, List, Optional, Tuple
+from pdf_parser import parse_pdf, iter_parse_pdf, ParseResult, PdfSource, PARSER_VERSION
+from llm_mapper import hybrid_field_mapper, hybrid_field_mapper_batch, warm_alias_index, alias_index_loaded, model, raw_key_cache, carrier_templates, llm_cache_stats, form_keys_signature, MAPPER_VERSION
+from llm_client import llm_client
+from result_cache import ResultCache
+from job_queue import JobQueue, JobWorkers, JOB_PRIORITIES
+from log_utils import LazyJson, configure_logging
+from metrics import stage, collect_timings, server_timing_header, register_collector, render_prometheus
 import os
 import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_alias_index()
+    start_job_workers()
+    yield
+    shutdown_pipeline()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,64 +35,533 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-def transform_to_legacy_format(parsed_data: Dict) -> Dict:
-    raw_data = {}
-    for section, section_data in parsed_data['raw_data'].items():
-        if isinstance(section_data, dict):
-            raw_data.update(section_data)
-        else:
-            raw_data[section] = section_data
+# Parts of a /parse-pdf/ response a client can ask for with ?include= (or ?fields=)
+INCLUDE_PARTS = ("mappedFields", "rawData", "tables", "fullText", "procedureCodes")
+# What a request without ?include= gets; procedureCodes repeats rawData["Procedure Codes"], so it is opt-in
+RESPONSE_PARTS = INCLUDE_PARTS[:4]
+
+# "thread" shares one model across workers; "process" loads one per worker but sidesteps the GIL
+PIPELINE_EXECUTOR = os.getenv("PIPELINE_EXECUTOR", "thread")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", str(os.cpu_count() or 1)))
+PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", str(PIPELINE_WORKERS * 4)))
+
+if PIPELINE_EXECUTOR == "process":
+    pipeline_executor = ProcessPoolExecutor(max_workers=PIPELINE_WORKERS)
+else:
+    pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+_pipeline_pending = 0
+
+# Uploads up to this size are read into memory. Larger ones are parsed straight from the temp file the upload was
+# spooled to, and hashed in chunks, so they are never held in memory as a whole.
+PDF_SPOOL_THRESHOLD = int(os.getenv("PDF_SPOOL_THRESHOLD", str(32 * 1024 * 1024)))
+
+# /parse-pdfs/ limits: files per request, and how many of them parse at once (clients may ask for fewer)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", str(PIPELINE_WORKERS)))
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+
+result_cache = ResultCache("parse-pdf", max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, path=RESULT_CACHE_PATH or None)
+
+# Job mode (POST /jobs, GET /jobs/{id}) is enabled by giving the queue a database path
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "86400"))
+job_queue = None
+job_workers = None
+
+# Per-stage durations go back to the client in a Server-Timing header (visible in browser dev tools)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# When the embedding model is loaded:
+#   "startup"    - in the lifespan startup, before the server accepts requests (default)
+#   "background" - on a thread started by the lifespan startup; /ready reports 503 until it is warm
+#   "lazy"       - on the first request that needs it
+#   "import"     - when this module is imported, so `gunicorn --preload` and the process pipeline
+#                  fork workers that share the already loaded model copy-on-write
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "startup")
+_import_started = time.perf_counter()
+cold_start_seconds = None
+
+def warm_model() -> None:
+    global cold_start_seconds
+    model.load()
+    warm_alias_index()
+    cold_start_seconds = time.perf_counter() - _import_started
+    logger.info("Service warm %.2fs after import", cold_start_seconds)
+
+if MODEL_PRELOAD == "import":
+    warm_model()
+
+def load_alias_index():
+    if MODEL_PRELOAD == "startup":
+        warm_model()
+    elif MODEL_PRELOAD == "background":
+        model.load_in_background(then=warm_model)
+    elif not alias_index_loaded():
+        # A saved alias index needs no model, so lazy mode still starts with it loaded when one exists
+        warm_alias_index(build=False)
+
+@app.get("/ready")
+def ready():
+    warm = model.ready and alias_index_loaded()
+    body = {
+        "ready": warm or MODEL_PRELOAD == "lazy",
+        "preload": MODEL_PRELOAD,
+        "alias_index": alias_index_loaded(),
+        "cold_start_seconds": round(cold_start_seconds, 3) if cold_start_seconds is not None else None,
+        "model": model.status()
+    }
+    return ORJSONResponse(body, status_code=200 if body["ready"] else 503)
+
+def start_job_workers():
+    global job_queue, job_workers
+    if not JOB_QUEUE_PATH:
+        return
+    job_queue = JobQueue(JOB_QUEUE_PATH, lease=JOB_LEASE, max_attempts=JOB_MAX_ATTEMPTS, retention=JOB_RETENTION)
+    # Jobs still queued (or lost mid-run) from before a restart are picked up here
+    job_workers = JobWorkers(job_queue, run_job, count=JOB_WORKERS)
+    job_workers.start()
+
+def shutdown_pipeline():
+    if job_workers is not None:
+        job_workers.stop()
+        job_queue.close()
+    pipeline_executor.shutdown(wait=False, cancel_futures=True)
+    llm_client.close()
+
+def transform_to_legacy_format(parsed_data: ParseResult) -> Dict:
     return {
-        'raw': raw_data,
-        'tables': parsed_data.get('tables', [])
+        'raw': parsed_data.flat_fields(),
+        'tables': parsed_data.tables
     }
 
-def map_eligibility_data(parsed_data: Dict) -> Dict:
+def parse_include(include: Optional[str]) -> Tuple[str, ...]:
+    if not include:
+        return RESPONSE_PARTS
+    requested = {part.strip() for part in include.split(",") if part.strip()}
+    unknown = requested - set(INCLUDE_PARTS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include values: {', '.join(sorted(unknown))}. Allowed: {', '.join(INCLUDE_PARTS)}")
+    return tuple(part for part in INCLUDE_PARTS if part in requested)
+
+def parse_options(include: Tuple[str, ...]) -> Dict:
+    # include only selects response keys: whatever the mapper reads is parsed whenever mappedFields is asked for
+    mapping = "mappedFields" in include
+    return {
+        "include_full_text": "fullText" in include,
+        "include_tables": mapping or "tables" in include,
+        "include_procedure_codes": mapping or "rawData" in include or "procedureCodes" in include
+    }
+
+def map_eligibility_data(parsed_data: ParseResult, include: Tuple[str, ...] = RESPONSE_PARTS,
+                         mapped_fields: Optional[Dict] = None) -> Dict:
     logger.info("Mapping eligibility data")
-    legacy_data = transform_to_legacy_format(parsed_data)
-    mapped_data = hybrid_field_mapper(legacy_data['raw'], legacy_data['tables'])
+    response = {}
+    if "mappedFields" in include:
+        if mapped_fields is None:
+            legacy_data = transform_to_legacy_format(parsed_data)
+            mapped_fields = hybrid_field_mapper(legacy_data['raw'], legacy_data['tables'], parsed_data.fingerprint)
+        response["mappedFields"] = mapped_fields
+    if "rawData" in include:
+        response["rawData"] = parsed_data.raw_data()
+    if "tables" in include:
+        response["tables"] = parsed_data.tables
+    if "fullText" in include:
+        response["fullText"] = parsed_data.full_text
+    if "procedureCodes" in include:
+        response["procedureCodes"] = parsed_data.procedure_codes
+    return response
+
+def upload_digest(source: PdfSource) -> str:
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+async def read_upload(file: UploadFile) -> Tuple[PdfSource, str]:
+    # What to parse, and its sha256
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, os.SEEK_END)
+        file.file.seek(0)
+    # The process pipeline can only be handed bytes
+    if size <= PDF_SPOOL_THRESHOLD or PIPELINE_EXECUTOR == "process":
+        contents = await file.read()
+        return contents, upload_digest(contents)
+    logger.info(f"Parsing {file.filename} ({size} bytes) from its spooled upload")
+    return file.file, await asyncio.get_running_loop().run_in_executor(None, upload_digest, file.file)
+
+def result_cache_key(digest: str, include: Tuple[str, ...] = RESPONSE_PARTS) -> str:
+    # Parser, mapper and form_keys versions are part of the key, so upgrades never serve stale results
+    return f"{PARSER_VERSION}:{MAPPER_VERSION}:{form_keys_signature()[:16]}:{','.join(include)}:{digest}"
+
+@app.get("/cache-stats")
+def cache_stats():
+    return {
+        "embeddings": raw_key_cache.stats(),
+        "results": result_cache.stats(),
+        "llm": llm_cache_stats(),
+        "templates": carrier_templates.stats()
+    }
+
+def parse_document(contents: PdfSource, filename: str, include: Tuple[str, ...] = RESPONSE_PARTS) -> ParseResult:
+    # Runs on a pipeline worker, never on the event loop
+    parsed_data = parse_pdf(contents, compact=True, **parse_options(include))
+    logger.info("Raw data extracted from %s: %s sections, %s procedure codes", filename,
+                len(parsed_data.sections), len(parsed_data.procedure_codes))
+    return parsed_data
+
+def map_eligibility_batch(parsed_list: List[ParseResult], include: Tuple[str, ...] = RESPONSE_PARTS) -> List[Dict]:
+    # One embedding pass for every raw key across the batch instead of one per document
+    if "mappedFields" not in include:
+        return [map_eligibility_data(parsed_data, include) for parsed_data in parsed_list]
+    legacy = [transform_to_legacy_format(parsed_data) for parsed_data in parsed_list]
+    mapped = hybrid_field_mapper_batch([data['raw'] for data in legacy], [data['tables'] for data in legacy],
+                                       [parsed_data.fingerprint for parsed_data in parsed_list])
+    return [map_eligibility_data(parsed_data, include, fields) for parsed_data, fields in zip(parsed_list, mapped)]
+
+def process_pdf(contents: PdfSource, filename: str, include: Tuple[str, ...] = RESPONSE_PARTS) -> Dict:
+    parsed_data = parse_document(contents, filename, include)
+    mapped_data = map_eligibility_data(parsed_data, include)
+    logger.debug("Mapped data: %s", LazyJson(mapped_data))
+    return mapped_data
+
+def process_pdf_timed(contents: PdfSource, filename: str, include: Tuple[str, ...] = RESPONSE_PARTS) -> Tuple[Dict, Dict[str, float]]:
+    # Timings are gathered on the worker and returned with the result, so this also works in the process pool
+    with collect_timings() as timings:
+        with stage("total"):
+            mapped_data = process_pdf(contents, filename, include)
+    return mapped_data, timings
+
+def iter_pdf_events(contents: PdfSource, filename: str, include: Tuple[str, ...] = RESPONSE_PARTS):
+    # Section events go out as pages are parsed; the mapped result follows once mapping finishes
+    parsed_data = None
+    for event in iter_parse_pdf(contents, compact=True, **parse_options(include)):
+        if event["type"] == "result":
+            parsed_data = event["data"]
+        else:
+            yield event
+    logger.info(f"Streamed sections for {filename}, mapping fields")
+    yield {"type": "mapped", "data": map_eligibility_data(parsed_data, include)}
+
+def check_pipeline_capacity() -> None:
+    if _pipeline_pending >= PIPELINE_MAX_PENDING:
+        logger.warning(f"Pipeline saturated ({_pipeline_pending} pending), rejecting request")
+        raise HTTPException(status_code=503, detail="Server busy, please retry shortly", headers={"Retry-After": "5"})
+
+def reserve_pipeline_slot() -> None:
+    global _pipeline_pending
+    # Only touched from the event loop thread, so no lock is needed
+    check_pipeline_capacity()
+    _pipeline_pending += 1
+
+def release_pipeline_slot() -> None:
+    global _pipeline_pending
+    _pipeline_pending -= 1
+
+async def run_in_pipeline(fn, *args):
+    reserve_pipeline_slot()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pipeline_executor, fn, *args)
+    finally:
+        release_pipeline_slot()
+
+async def cached_result(cache_key: str) -> Optional[Dict]:
+    # With RESULT_CACHE_PATH set a lookup is a SQLite read plus json.loads of a whole response: keep it off the loop
+    if result_cache.path is None:
+        return result_cache.get(cache_key)
+    return await asyncio.get_running_loop().run_in_executor(None, result_cache.get, cache_key)
+
+async def store_result(cache_key: str, data: Dict) -> None:
+    if result_cache.path is None:
+        result_cache.set(cache_key, data)
+        return
+    await asyncio.get_running_loop().run_in_executor(None, result_cache.set, cache_key, data)
+
+async def stream_in_pipeline(events):
+    # The slot is taken here, not by the endpoint: a client that disconnects before the body starts must not leak
+    # it. The endpoint checks capacity up front, so saturation still surfaces as a 503.
+    loop = asyncio.get_running_loop()
+    # Generators cannot cross process boundaries, so the process pool streams on the default thread pool
+    executor = pipeline_executor if isinstance(pipeline_executor, ThreadPoolExecutor) else None
+    done = object()
+    try:
+        reserve_pipeline_slot()
+    except HTTPException:
+        events.close()
+        raise
+    try:
+        while True:
+            event = await loop.run_in_executor(executor, next, events, done)
+            if event is done:
+                break
+            yield event
+    finally:
+        release_pipeline_slot()
+        try:
+            events.close()
+        except ValueError:
+            # Still running on a worker after a client disconnect; it finishes on its own
+            pass
+
+@app.get("/pipeline-stats")
+def pipeline_stats():
     return {
-        "mappedFields": mapped_data,
-        "rawData": parsed_data['raw_data'],
-        "tables": legacy_data['tables'],
-        "fullText": parsed_data.get("full_text", "")
+        "executor": PIPELINE_EXECUTOR,
+        "workers": PIPELINE_WORKERS,
+        "max_pending": PIPELINE_MAX_PENDING,
+        "pending": _pipeline_pending,
+        "llm_in_flight": llm_client.in_flight,
+        "llm_max_concurrency": llm_client.max_concurrency
     }
 
+def timed_response(content: Dict, timings: Dict[str, float]) -> ORJSONResponse:
+    headers = {"Server-Timing": server_timing_header(timings)} if SERVER_TIMING and timings else None
+    return ORJSONResponse(content, headers=headers)
+
+def cache_metrics() -> List[str]:
+    lines = [
+        "# HELP pdf_mapper_cache_lookups_total Cache lookups by cache and outcome",
+        "# TYPE pdf_mapper_cache_lookups_total counter"
+    ]
+    caches = {"results": result_cache.stats(), "embeddings": raw_key_cache.stats(), "llm": llm_cache_stats()}
+    for name, stats in caches.items():
+        for outcome in ("hits", "disk_hits", "misses"):
+            if outcome in stats:
+                lines.append(f'pdf_mapper_cache_lookups_total{{cache="{name}",outcome="{outcome}"}} {stats[outcome]}')
+    lines += [
+        "# HELP pdf_mapper_pipeline_pending Requests queued or running on the pipeline executor",
+        "# TYPE pdf_mapper_pipeline_pending gauge",
+        f"pdf_mapper_pipeline_pending {_pipeline_pending}",
+        "# HELP pdf_mapper_llm_in_flight LLM requests currently in flight",
+        "# TYPE pdf_mapper_llm_in_flight gauge",
+        f"pdf_mapper_llm_in_flight {llm_client.in_flight}"
+    ]
+    return lines
+
+register_collector(cache_metrics)
+
+def model_metrics() -> List[str]:
+    lines = [
+        "# HELP pdf_mapper_model_ready Whether the embedding model is loaded and warm",
+        "# TYPE pdf_mapper_model_ready gauge",
+        f"pdf_mapper_model_ready {int(model.ready)}"
+    ]
+    if cold_start_seconds is not None:
+        lines += [
+            "# HELP pdf_mapper_cold_start_seconds Seconds from importing the service to a warm model and alias index",
+            "# TYPE pdf_mapper_cold_start_seconds gauge",
+            f"pdf_mapper_cold_start_seconds {cold_start_seconds:.3f}"
+        ]
+    return lines
+
+register_collector(model_metrics)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.post("/parse-pdf/")
-async def parse_pdf_endpoint(file: UploadFile = File(...)):
-    tmp_path = None
+async def parse_pdf_endpoint(file: UploadFile = File(...), include: Optional[str] = Query(None),
+                             fields: Optional[str] = Query(None)):
     try:
         logger.info(f"Processing PDF at {datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')}: {file.filename}")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(await file.read())
-            tmp_path = tmp.name
-        parsed_data = parse_pdf(tmp_path)
-        logger.info(f"Raw data extracted from {file.filename}:\n{json.dumps(parsed_data['raw_data'], indent=2)}")
-        logger.debug(f"Full parsed data for {file.filename}: {json.dumps(parsed_data, indent=2)}")
-        mapped_data = map_eligibility_data(parsed_data)
-        logger.debug(f"Mapped data: {json.dumps(mapped_data, indent=2)}")
-        return {"status": "success", "data": mapped_data}
+        parts = parse_include(include or fields)
+        contents, digest = await read_upload(file)
+        cache_key = result_cache_key(digest, parts)
+        with collect_timings() as timings:
+            with stage("cache_lookup"):
+                cached = await cached_result(cache_key)
+        if cached is not None:
+            logger.info(f"Serving cached result for {file.filename}")
+            return timed_response({"status": "success", "data": cached}, timings)
+        mapped_data, pipeline_timings = await run_in_pipeline(process_pdf_timed, contents, file.filename, parts)
+        timings.update(pipeline_timings)
+        await store_result(cache_key, mapped_data)
+        return timed_response({"status": "success", "data": mapped_data}, timings)
+    except HTTPException:
+        raise
     except NameError as e:
         logger.error(f"NameError processing PDF {file.filename}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
     except Exception as e:
         logger.error(f"Error processing PDF {file.filename}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to process PDF: {str(e)}")
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            for attempt in range(3):
+
+
+def format_stream_event(event: Dict, fmt: str) -> str:
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {orjson.dumps(event).decode('utf-8')}\n\n"
+    return orjson.dumps(event).decode("utf-8") + "\n"
+
+@app.post("/parse-pdf/stream")
+async def parse_pdf_stream_endpoint(file: UploadFile = File(...), format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+                                    include: Optional[str] = Query(None), fields: Optional[str] = Query(None)):
+    logger.info(f"Streaming PDF at {datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')}: {file.filename}")
+    parts = parse_include(include or fields)
+    contents, digest = await read_upload(file)
+    cache_key = result_cache_key(digest, parts)
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    cached = await cached_result(cache_key)
+    if cached is not None:
+        logger.info(f"Serving cached result for {file.filename}")
+        return StreamingResponse(iter([format_stream_event({"type": "mapped", "data": cached}, format)]), media_type=media_type)
+
+    check_pipeline_capacity()
+
+    async def body():
+        try:
+            async for event in stream_in_pipeline(iter_pdf_events(contents, file.filename, parts)):
+                if event["type"] == "mapped":
+                    await store_result(cache_key, event["data"])
+                yield format_stream_event(event, format)
+        except Exception as e:
+            logger.error(f"Error streaming PDF {file.filename}: {str(e)}", exc_info=True)
+            yield format_stream_event({"type": "error", "detail": f"Failed to process PDF: {str(e)}"}, format)
+
+    return StreamingResponse(body(), media_type=media_type)
+
+def batch_error(index: int, filename: str, e: Exception) -> Dict:
+    if isinstance(e, HTTPException):
+        return {"index": index, "filename": filename, "status": "error", "code": e.status_code, "detail": e.detail}
+    logger.error(f"Error processing PDF {filename} in batch: {str(e)}", exc_info=True)
+    return {"index": index, "filename": filename, "status": "error", "code": 500, "detail": f"Failed to process PDF: {str(e)}"}
+
+async def iter_batch_results(uploads: List[Tuple[str, PdfSource, str]], parts: Tuple[str, ...], parallelism: int):
+    # Yields one result per upload as soon as it is ready, each tagged with the upload's index
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def parse_one(filename: str, contents: PdfSource) -> ParseResult:
+        async with semaphore:
+            return await run_in_pipeline(parse_document, contents, filename, parts)
+
+    tasks = {}
+    by_key = {}
+    try:
+        for index, (filename, contents, digest) in enumerate(uploads):
+            cache_key = result_cache_key(digest, parts)
+            if cache_key in by_key:
+                # The same report uploaded twice is parsed once
+                by_key[cache_key].append((index, filename))
+                continue
+            cached = await cached_result(cache_key)
+            if cached is not None:
+                yield {"index": index, "filename": filename, "status": "success", "cached": True, "data": cached}
+                continue
+            by_key[cache_key] = [(index, filename)]
+            tasks[asyncio.create_task(parse_one(filename, contents))] = cache_key
+
+        pending = set(tasks)
+        while pending:
+            # Whatever finished parsing while the previous batch was mapping is mapped together
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            parsed = []
+            for task in done:
+                cache_key = tasks[task]
                 try:
-                    os.remove(tmp_path)
-                    logger.debug(f"Successfully deleted temporary file: {tmp_path}")
-                    break
-                except PermissionError as e:
-                    logger.warning(f"Attempt {attempt + 1}: Failed to delete {tmp_path}: {str(e)}. Retrying after delay...")
-                    time.sleep(1)
+                    parsed.append((cache_key, task.result()))
                 except Exception as e:
-                    logger.error(f"Unexpected error deleting {tmp_path}: {str(e)}")
-                    break
-            else:
-                logger.error(f"Failed to delete temporary file after retries: {tmp_path}")
\ No newline at end of file
+                    for index, filename in by_key[cache_key]:
+                        yield batch_error(index, filename, e)
+            if not parsed:
+                continue
+            try:
+                mapped = await run_in_pipeline(map_eligibility_batch, [data for _, data in parsed], parts)
+            except Exception as e:
+                for cache_key, _ in parsed:
+                    for index, filename in by_key[cache_key]:
+                        yield batch_error(index, filename, e)
+                continue
+            for (cache_key, _), mapped_data in zip(parsed, mapped):
+                await store_result(cache_key, mapped_data)
+                for index, filename in by_key[cache_key]:
+                    yield {"index": index, "filename": filename, "status": "success", "cached": False, "data": mapped_data}
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@app.post("/parse-pdfs/")
+async def parse_pdfs_endpoint(files: List[UploadFile] = File(...), format: str = Query("json", pattern="^(json|ndjson)$"),
+                              parallelism: Optional[int] = Query(None, ge=1), include: Optional[str] = Query(None),
+                              fields: Optional[str] = Query(None)):
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} files per batch")
+    parts = parse_include(include or fields)
+    limit = min(parallelism or BATCH_PARALLELISM, BATCH_PARALLELISM)
+    logger.info(f"Processing batch of {len(files)} PDFs at {datetime.now().strftime('%Y-%m-%d %H:%M:%S %Z')} with parallelism {limit}")
+    uploads = [(file.filename, *await read_upload(file)) for file in files]
+    results = iter_batch_results(uploads, parts, limit)
+
+    if format == "ndjson":
+        async def body():
+            async for result in results:
+                yield orjson.dumps(result) + b"\n"
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    collected = sorted([result async for result in results], key=lambda result: result["index"])
+    failed = sum(result["status"] == "error" for result in collected)
+    status = "success" if not failed else "error" if failed == len(collected) else "partial"
+    return {"status": status, "failed": failed, "results": collected}
+
+def run_job(job: Dict) -> Dict:
+    # Runs on a job worker thread; same work as /parse-pdf/, including the result cache
+    parts = tuple(job["options"]["include"])
+    cache_key = result_cache_key(upload_digest(job["payload"]), parts)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    # Parsed on the pipeline executor like every upload, so jobs share its worker bound. They are not counted
+    # against PIPELINE_MAX_PENDING: a job waits in its queue instead of being turned away.
+    mapped_data = pipeline_executor.submit(process_pdf, job["payload"], job["filename"], parts).result()
+    result_cache.set(cache_key, mapped_data)
+    return mapped_data
+
+def require_job_queue() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job mode is disabled; set JOB_QUEUE_PATH to enable it")
+    return job_queue
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...), priority: str = Query("normal", pattern="^(interactive|normal|bulk)$"),
+                     include: Optional[str] = Query(None), fields: Optional[str] = Query(None)):
+    queue = require_job_queue()
+    parts = parse_include(include or fields)
+    contents = await file.read()
+    # The upload is written to SQLite off the event loop
+    job_id = await asyncio.get_running_loop().run_in_executor(
+        None, queue.submit, file.filename, contents, {"include": list(parts)}, JOB_PRIORITIES[priority])
+    job_workers.notify()
+    logger.info(f"Queued job {job_id} for {file.filename} at priority {priority}")
+    return {"status": "queued", "id": job_id, "url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = require_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/job-stats")
+def job_stats():
+    return {"enabled": job_queue is not None, "workers": JOB_WORKERS, **(job_queue.stats() if job_queue else {})}
+
+def job_metrics() -> List[str]:
+    if job_queue is None:
+        return []
+    lines = ["# HELP pdf_mapper_jobs Jobs in the queue by status", "# TYPE pdf_mapper_jobs gauge"]
+    lines += [f'pdf_mapper_jobs{{status="{status}"}} {count}' for status, count in job_queue.stats().items()]
+    return lines
+
+register_collector(job_metrics)
@@ -0,0 +1,96 @@
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from embedding_backends import backend_loader
+
+logger = logging.getLogger(__name__)
+
+class ModelProvider:
+    # Owns the embedding model so importing the mapper never pays for torch or the model load
+    def __init__(self, model_name: str, backend: str = "sentence-transformers", model_path: str = "",
+                 warmup_text: str = "Patient Name"):
+        self.model_name = model_name
+        self.backend = backend
+        self.model_path = model_path
+        self.warmup_text = warmup_text
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "cold"
+        self.error = None
+        self.import_seconds = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready_at = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "warm"
+
+    def get(self):
+        if self._model is None:
+            self.load()
+        return self._model
+
+    def load(self):
+        with self._lock:
+            if self._model is not None:
+                return self._model
+            self.state = "loading"
+            try:
+                start = time.perf_counter()
+                load_model = backend_loader(self.backend)
+                imported = time.perf_counter()
+                model = load_model(self.model_name, self.model_path)
+                loaded = time.perf_counter()
+                # The first encode allocates the backend's buffers; do it here rather than on a request
+                model.encode([self.warmup_text], convert_to_numpy=True, normalize_embeddings=True)
+                warmed = time.perf_counter()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                logger.error(f"Failed to load embedding model {self.model_name} ({self.backend}): {e}", exc_info=True)
+                raise
+            self.import_seconds = imported - start
+            self.load_seconds = loaded - imported
+            self.warmup_seconds = warmed - loaded
+            self.ready_at = time.time()
+            self._model = model
+            self.state = "warm"
+            self.error = None
+            logger.info("Embedding model %s (%s) warm in %.2fs (import %.2fs, load %.2fs, warmup %.2fs)",
+                        self.model_name, self.backend, warmed - start, self.import_seconds, self.load_seconds, self.warmup_seconds)
+            return model
+
+    def load_in_background(self, then=None) -> threading.Thread:
+        def run():
+            try:
+                self.load()
+                if then is not None:
+                    then()
+            except Exception:
+                pass
+
+        self._thread = threading.Thread(target=run, name="model-loader", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def encode(self, *args, **kwargs):
+        return self.get().encode(*args, **kwargs)
+
+    def status(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "state": self.state,
+            "error": self.error,
+            "import_seconds": round(self.import_seconds, 3) if self.import_seconds is not None else None,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None
+        }
@@ -0,0 +1,79 @@
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+DEFAULT_RESPONSE = {
+    "subscriberId": "U93162774 01",
+    "planName": "DENTAL PPO",
+    "insuranceType": "PPO",
+    "benefitsCoordinationMethod": "No"
+}
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests_seen.append(body)
+        text = json.dumps(server.response_body) + "\nTrailing commentary the client should never read."
+        tokens = [text[i:i + 8] for i in range(0, len(text), 8)]
+        if not body.get("stream", True):
+            payload = json.dumps({"model": body.get("model"), "response": text, "done": True}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                line = json.dumps({"response": token, "done": i == len(tokens) - 1}).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+                if server.token_delay:
+                    time.sleep(server.token_delay)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with server.lock:
+                server.early_disconnects += 1
+
+def start_stub_server(port: int = 0, response_body: Optional[Dict] = None, token_delay: float = 0.0) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), OllamaStubHandler)
+    server.daemon_threads = True
+    server.response_body = response_body or DEFAULT_RESPONSE
+    server.token_delay = token_delay
+    server.requests_seen = []
+    server.early_disconnects = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama /api/generate endpoint")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+    server = start_stub_server(args.port, token_delay=args.token_delay)
+    print(f"Ollama stub listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
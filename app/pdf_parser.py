@@ -1,43 +1,343 @@
 import fitz  # PyMuPDF
+import os
 import re
-import json
-from typing import Dict, Tuple, List
-from collections import defaultdict
+import sys
+import mmap
+import time
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Tuple, List, Optional, Union, BinaryIO
 import logging
+from log_utils import LazyJson, configure_logging
+from metrics import timed_stage, record_stage, PAGES, BLOCKS, KV_EXTRACTIONS
 
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-def parse_pdf(file_path: str) -> Dict:
-    logger.info(f"Parsing PDF: {file_path}")
-    doc = fitz.open(file_path)
-    data = defaultdict(dict)
+# Bump whenever parse output changes so cached results are invalidated
+PARSER_VERSION = "4"
+
+# Documents with at least this many pages have their text extracted in a process pool (0 disables)
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PARALLEL_PAGE_THRESHOLD", "40"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+def describe_source(source: PdfSource) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes in memory>"
+    return f"<stream {getattr(source, 'name', type(source).__name__)}>"
+
+def map_file(stream: BinaryIO) -> Optional[memoryview]:
+    # A stream backed by a file on disk is mapped rather than read, so the document is paged in from the page
+    # cache instead of being copied onto the heap. The mapping outlives the stream being closed.
+    try:
+        return memoryview(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ))
+    except (AttributeError, OSError, ValueError):
+        return None
+
+def open_pdf(source: PdfSource) -> fitz.Document:
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    if hasattr(source, "read"):
+        return fitz.open(stream=source.read(), filetype="pdf")
+    raise TypeError(f"Unsupported PDF source: {type(source).__name__}")
+
+# Same flags get_text("blocks") uses by default, so image blocks stay out of the text
+PAGE_TEXT_FLAGS = fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
+
+class _PageTiming(threading.local):
+    # Per-thread running totals of per-page work; parse_pdf records each per-document delta as one observation,
+    # so these stages count documents like every other stage
+    fitz_text = 0.0
+    extract_tables = 0.0
+
+_page_timing = _PageTiming()
+
+def extract_page_content(page) -> Tuple[List[tuple], List[str]]:
+    # One MuPDF text pass per page: reading-order blocks for the section parser, stripped lines for tables
+    start = time.perf_counter()
+    page_dict = page.get_text("dict", flags=PAGE_TEXT_FLAGS)
+    _page_timing.fitz_text += time.perf_counter() - start
+    blocks = []
+    lines = []
+    for block in page_dict["blocks"]:
+        if block.get("type", 0) != 0:
+            continue
+        block_lines = ["".join(span["text"] for span in line["spans"]) for line in block["lines"]]
+        x0, y0, x1, y1 = block["bbox"]
+        blocks.append((x0, y0, x1, y1, "\n".join(block_lines)))
+        lines.extend(line.strip() for line in block_lines if line.strip())
+    blocks.sort(key=lambda block: (block[1], block[0]))
+    return blocks, lines
+
+def prepare_page(page, include_tables: bool = True) -> Tuple[List[str], List[Dict]]:
+    blocks, lines = extract_page_content(page)
+    block_texts = [text for text in (block[4].strip() for block in blocks) if text]
+    if not include_tables:
+        return block_texts, []
+    start = time.perf_counter()
+    tables = extract_tables_from_lines(lines)
+    _page_timing.extract_tables += time.perf_counter() - start
+    return block_texts, tables
+
+def _prepare_page_range(source: Union[str, bytes], start: int, stop: int, include_tables: bool = True) -> List[Tuple[List[str], List[Dict]]]:
+    # Runs in a parse worker process; each worker opens its own copy of the document
+    doc = open_pdf(source)
+    try:
+        return [prepare_page(doc[number], include_tables) for number in range(start, stop)]
+    finally:
+        doc.close()
+
+def _get_parse_executor() -> ProcessPoolExecutor:
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        return _parse_executor
+
+def _discard_parse_executor(executor: ProcessPoolExecutor) -> None:
+    # A broken pool stays broken; drop it so the next long document gets a fresh one
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is not executor:
+            return
+        _parse_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_prepared_pages(doc: fitz.Document, source: PdfSource, include_tables: bool = True):
+    page_count = len(doc)
+    use_parallel = (
+        PARALLEL_PAGE_THRESHOLD > 0 and page_count >= PARALLEL_PAGE_THRESHOLD and PARSE_WORKERS > 1
+        and isinstance(source, (str, os.PathLike, bytes))
+    )
+    if use_parallel:
+        chunk = -(-page_count // PARSE_WORKERS)
+        ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+        yielded = 0
+        executor = None
+        try:
+            executor = _get_parse_executor()
+            futures = [executor.submit(_prepare_page_range, source, start, stop, include_tables) for start, stop in ranges]
+            logger.info("Extracting %s pages across %s worker processes", page_count, len(ranges))
+            # Stitch the ranges back in page order, so the section state machine sees the serial sequence;
+            # each range is handed on as soon as it and the ones before it are done
+            for future in futures:
+                for prepared in future.result():
+                    yield prepared
+                    yielded += 1
+        except (OSError, RuntimeError, BrokenProcessPool) as e:
+            logger.warning(f"Parallel page extraction unavailable ({e}), falling back to serial")
+            if isinstance(e, BrokenProcessPool) and executor is not None:
+                _discard_parse_executor(executor)
+        else:
+            return
+        # Pages already handed on are not extracted again
+        for number in range(yielded, page_count):
+            yield prepare_page(doc[number], include_tables)
+        return
+    for page in doc:
+        yield prepare_page(page, include_tables)
+
+SECTION_KEYWORDS = ["patient detail", "plan and network", "plan details", "frequency & limitations", "benefits", "procedure code search"]
+# Only the first blocks of a document go into its layout fingerprint; that is where carriers' headers live.
+# They are counted across pages, so a header that spills onto page 2 still hashes alike.
+FINGERPRINT_BLOCKS = 60
+# An all-caps block counts as a heading for the fingerprint only if it uses one of these words; "JANE DOE" or
+# "DENTAL PPO" are values that happen to be printed in capitals
+HEADING_WORDS = frozenset({
+    "patient", "member", "subscriber", "plan", "network", "benefits", "benefit", "coverage", "eligibility",
+    "frequency", "limitations", "procedure", "information", "detail", "details", "summary", "maximums", "history"
+})
+_DIGITS_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"[a-z]+")
+
+def is_section_heading(text: str) -> bool:
+    return text.isupper() or any(keyword in text.lower() for keyword in SECTION_KEYWORDS)
+
+def _fingerprint_part(text: str) -> Optional[str]:
+    # Labels and headings only, with digits and anything after a colon dropped, so values never reach the hash
+    if ":" in text:
+        kv = extract_insurance_kv(text)
+        label = kv[0] if kv else text.split(":", 1)[0]
+        return _DIGITS_RE.sub("9", label.strip().lower()) or None
+    if is_section_heading(text):
+        heading = text.strip().lower()
+        if any(keyword in heading for keyword in SECTION_KEYWORDS) or HEADING_WORDS.intersection(_WORD_RE.findall(heading)):
+            return "#" + _DIGITS_RE.sub("9", heading)
+    return None
+
+def layout_fingerprint(first_blocks: List[str], producer: str = "") -> str:
+    # Same template, same hash: procedure codes (how many fit on page 1 varies) and repeated labels are left out
+    skeleton = [producer or ""]
+    seen = set()
+    for text in first_blocks[:FINGERPRINT_BLOCKS]:
+        part = _fingerprint_part(text)
+        if part is None or part in seen:
+            continue
+        if part.startswith("#") and "procedure code" in part:
+            break
+        seen.add(part)
+        skeleton.append(part)
+    return hashlib.sha256("\n".join(skeleton).encode("utf-8")).hexdigest()[:16]
+
+def classify_section(section: str) -> str:
+    name = section.lower()
+    if "patient" in name:
+        return "patient_detail"
+    if "plan" in name:
+        return "plan"
+    if "benefits" in name:
+        return "benefits"
+    if "procedure code" in name:
+        return "procedure_codes"
+    return "section"
+
+def _plain(value):
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+class ParseResult:
+    # What the parser builds, with field names interned so repeated labels share one string.
+    # The legacy nested shape (raw_data, patient_info, ...) is produced on demand at the response boundary.
+    __slots__ = ("sections", "benefits", "procedure_codes", "tables", "text_blocks", "fingerprint")
+
+    def __init__(self, sections: Dict, benefits: Dict, procedure_codes: Dict[str, Dict[str, str]], tables: List,
+                 text_blocks: List[str], fingerprint: Optional[str]):
+        self.sections = sections
+        self.benefits = benefits
+        self.procedure_codes = procedure_codes
+        self.tables = tables
+        self.text_blocks = text_blocks
+        self.fingerprint = fingerprint
+
+    @property
+    def full_text(self) -> str:
+        return "\n".join(self.text_blocks)
+
+    def raw_data(self) -> Dict:
+        raw = dict(self.sections)
+        if self.benefits:
+            raw["Benefits"] = self.benefits
+        if self.procedure_codes:
+            raw["Procedure Codes"] = self.procedure_codes
+        return raw
+
+    def flat_fields(self) -> Dict:
+        # Section names dropped and their fields merged, which is what the field mapper matches against
+        flat = {}
+        for section, section_data in self.raw_data().items():
+            if isinstance(section_data, dict):
+                flat.update(section_data)
+            else:
+                flat[section] = section_data
+        return flat
+
+    def to_dict(self) -> Dict:
+        data = self.raw_data()
+        return {
+            "patient_info": extract_patient_data(data),
+            "plan_info": extract_plan_data(data),
+            "benefits": extract_benefits_data(None, data),
+            "last_procedures": extract_procedure_dates(data),
+            "procedure_codes": extract_procedure_codes(data),
+            "raw_data": data,
+            "tables": self.tables,
+            "full_text": self.full_text,
+            "fingerprint": self.fingerprint
+        }
+
+def _benefit_group(benefits: Dict, subsection: str) -> Dict:
+    # Once an Orthodontics heading appears, Benefit Maximums fields nest under it
+    group = benefits.setdefault(subsection, {})
+    if subsection == "Benefit Maximums" and "Orthodontics" in group:
+        return group["Orthodontics"]
+    return group
+
+def _section_events(section: str, data: Dict, benefits_data: Dict, procedure_codes: Dict, pending_code: str,
+                    sent_benefits: Dict) -> List[Dict]:
+    events = []
+    if pending_code and pending_code in procedure_codes:
+        events.append({"type": "procedure_code", "code": pending_code, "fields": dict(procedure_codes[pending_code])})
+    if section and section.lower() == "benefits":
+        # A report can have several Benefits sections; each event carries only the subsections new or changed since the last
+        changed = {}
+        for subsection, fields in benefits_data.items():
+            fields = _plain(fields)
+            if sent_benefits.get(subsection) != fields:
+                changed[subsection] = sent_benefits[subsection] = fields
+        if changed:
+            events.append({"type": "benefits", "section": section, "fields": changed})
+    elif section and data.get(section):
+        events.append({"type": classify_section(section), "section": section, "fields": _plain(data[section])})
+    return events
+
+@timed_stage("parse_pdf")
+def parse_pdf(source: PdfSource, include_full_text: bool = True, include_tables: bool = True,
+              include_procedure_codes: bool = True, compact: bool = False) -> Union[Dict, ParseResult]:
+    result = None
+    for event in iter_parse_pdf(source, include_full_text, include_tables, include_procedure_codes, compact):
+        if event["type"] == "result":
+            result = event["data"]
+    return result
+
+def iter_parse_pdf(source: PdfSource, include_full_text: bool = True, include_tables: bool = True,
+                   include_procedure_codes: bool = True, compact: bool = False):
+    # With compact=True the result event carries the ParseResult itself instead of the legacy dict
+    logger.info("Parsing PDF: %s", describe_source(source))
+    if isinstance(source, memoryview):
+        source = source.tobytes()
+    elif isinstance(source, bytearray):
+        source = bytes(source)
+    elif not isinstance(source, (str, os.PathLike, bytes)) and hasattr(source, "read"):
+        source = map_file(source) or source.read()
+    doc = open_pdf(source)
+    data = {}
     full_text = []
     tables = []
     current_section = None
     current_subsection = None
     current_field = None
-    benefits_data = defaultdict(lambda: defaultdict(dict))
-    procedure_codes = defaultdict(dict)
+    benefits_data = {}
+    sent_benefits = {}
+    procedure_codes = {}
     last_key = None
     partial_key = ""
     current_services = ""
+    pending_code = None
 
     try:
-        for page in doc:
-            blocks = page.get_text("blocks")
-            blocks.sort(key=lambda block: (block[1], block[0]))
-            for block in blocks:
-                text = block[4].strip()
-                if not text:
-                    continue
-                full_text.append(text)
-                logger.debug(f"Processing block: {text}")
-                if text.isupper() or any(keyword in text.lower() for keyword in ["patient detail", "plan and network", "plan details", "frequency & limitations", "benefits", "procedure code search"]):
+        page_count = len(doc)
+        kv_calls, kv_seconds = _kv_timing.calls, _kv_timing.seconds
+        page_seconds = {name: getattr(_page_timing, name) for name in ("fitz_text", "extract_tables")}
+        block_count = 0
+        fingerprint_blocks = []
+        for page_number, (block_texts, page_tables) in enumerate(iter_prepared_pages(doc, source, include_tables), start=1):
+            block_count += len(block_texts)
+            if len(fingerprint_blocks) < FINGERPRINT_BLOCKS:
+                fingerprint_blocks.extend(block_texts[:FINGERPRINT_BLOCKS - len(fingerprint_blocks)])
+            for text in block_texts:
+                if include_full_text:
+                    full_text.append(text)
+                logger.debug("Processing block: %s", text)
+                if is_section_heading(text):
+                    # The previous section is complete once the next heading appears
+                    yield from _section_events(current_section, data, benefits_data, procedure_codes, pending_code, sent_benefits)
+                    pending_code = None
                     current_section = text.strip().title()
-                    logger.debug(f"Detected section: {current_section}")
+                    logger.debug("Detected section: %s", current_section)
                     if current_section.lower() == "benefits":
-                        logger.debug(f"Full text of Benefits section: {text}")
+                        logger.debug("Full text of Benefits section: %s", text)
                     current_subsection = None
                     current_field = None
                     partial_key = ""
@@ -47,111 +347,107 @@ def parse_pdf(file_path: str) -> Dict:
                 if current_section and current_section.lower() == "benefits":
                     if partial_key and not text.startswith("  ") and not text.lower().startswith("total:") and not re.match(r'^\$\d+[\d,.]*$', text):
                         if last_key:
-                            benefits_data[current_subsection or "General"][last_key] = {"Text": partial_key.strip()}
-                            logger.debug(f"Completed multi-line key: {last_key} = {partial_key.strip()}")
+                            benefits_data.setdefault(current_subsection or "General", {})[last_key] = {"Text": partial_key.strip()}
+                            logger.debug("Completed multi-line key: %s = %s", last_key, partial_key.strip())
                         partial_key = ""
 
                     if text.lower() == "benefit maximums":
                         current_subsection = "Benefit Maximums"
                         current_field = None
                         current_services = ""
-                        logger.debug(f"Detected subsection: {current_subsection}")
+                        logger.debug("Detected subsection: %s", current_subsection)
                         continue
                     elif text.lower() == "orthodontics" and current_subsection == "Benefit Maximums":
-                        benefits_data[current_subsection]["Orthodontics"] = {}
+                        benefits_data.setdefault(current_subsection, {})["Orthodontics"] = {}
                         current_field = None
                         current_services = ""
-                        logger.debug(f"Detected Orthodontics under Benefit Maximums")
+                        logger.debug("Detected Orthodontics under Benefit Maximums")
                         continue
 
                     service_pattern = r"^(Diagnostic and Preventive|Basic Restorative|Major Restorative|Orthodontics)(?:,\s*(?:Diagnostic and Preventive|Basic Restorative|Major Restorative|Orthodontics))*$"
                     if re.match(service_pattern, text) and not text.lower().startswith("total:"):
                         current_services = text.strip()
-                        logger.debug(f"Captured services: {current_services}")
+                        logger.debug("Captured services: %s", current_services)
                         continue
 
                     if "deductible remaining" in text.lower() and current_subsection != "Benefit Maximums":
                         current_subsection = "Deductible"
                         if current_services:
-                            benefits_data[current_subsection]["Services"] = current_services
-                            logger.debug(f"Inferred Deductible subsection with services: {current_services}")
+                            benefits_data.setdefault(current_subsection, {})["Services"] = current_services
+                            logger.debug("Inferred Deductible subsection with services: %s", current_services)
                         current_services = ""
 
                     if not text.startswith("  "):
                         remaining_match = re.match(r"^(.*)\s+remaining\s*[:]\s*(\$\d+[\d,.]*)$", text)
                         if remaining_match:
                             current_field = remaining_match.group(1).strip()
-                            if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
-                                benefits_data[current_subsection]["Orthodontics"][current_field] = {
-                                    "Remaining": remaining_match.group(2)
-                                }
-                            else:
-                                benefits_data[current_subsection or "General"][current_field] = {
-                                    "Remaining": remaining_match.group(2)
-                                }
+                            _benefit_group(benefits_data, current_subsection or "General")[current_field] = {
+                                "Remaining": remaining_match.group(2)
+                            }
                             last_key = current_field
-                            logger.debug(f"Detected benefits field with remaining: {current_field}, Remaining: {remaining_match.group(2)}")
+                            logger.debug("Detected benefits field with remaining: %s, Remaining: %s", current_field, remaining_match.group(2))
                         elif re.match(r'^\$\d+[\d,.]*$', text):
                             continue
                         else:
                             current_field = text.strip()
                             if not current_field.startswith("Total:"):
-                                benefits_data[current_subsection or "General"][current_field] = {}
+                                benefits_data.setdefault(current_subsection or "General", {})[current_field] = {}
                                 last_key = current_field
                                 partial_key = current_field
-                                logger.debug(f"Detected benefits field: {current_field}")
+                                logger.debug("Detected benefits field: %s", current_field)
                             continue
                     if current_field:
                         if text.startswith("  "):
                             kv = extract_insurance_kv(text.strip())
                             if kv:
                                 key, value = kv
-                                if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
-                                    benefits_data[current_subsection]["Orthodontics"][current_field][key] = value
-                                else:
-                                    benefits_data[current_subsection or "General"][current_field][key] = value
-                                logger.debug(f"Extracted subfield for {current_field}: {key} = {value}")
+                                group = _benefit_group(benefits_data, current_subsection or "General")
+                                group.setdefault(current_field, {})[sys.intern(key)] = value
+                                logger.debug("Extracted subfield for %s: %s = %s", current_field, key, value)
                                 continue
                         elif text.lower().startswith("total:"):
                             match = re.match(r"^Total\s*[:]\s*(\$\d+[\d,.]*)$", text)
                             if match:
-                                if current_subsection == "Benefit Maximums" and "Orthodontics" in benefits_data[current_subsection]:
-                                    benefits_data[current_subsection]["Orthodontics"][current_field]["Total"] = match.group(1)
-                                else:
-                                    benefits_data[current_subsection or "General"][current_field]["Total"] = match.group(1)
-                                logger.debug(f"Extracted Total for {current_field}: {match.group(1)}")
+                                group = _benefit_group(benefits_data, current_subsection or "General")
+                                group.setdefault(current_field, {})["Total"] = match.group(1)
+                                logger.debug("Extracted Total for %s: %s", current_field, match.group(1))
                                 current_field = None
                                 last_key = None
                         else:
                             partial_key += " " + text.strip()
                             continue
                 elif current_section and current_section.lower() == "procedure code search":
+                    if not include_procedure_codes:
+                        continue
                     # Handle CDT codes
                     cdt_match = re.match(r"^(D\d{4})\s*(.*?)(?=\n|$)", text, re.DOTALL)
                     if cdt_match:
                         code = cdt_match.group(1)
                         description = cdt_match.group(2).strip().replace("\n", " ")
+                        yield from _section_events(None, data, benefits_data, procedure_codes, pending_code, sent_benefits)
                         current_field = f"{code} - {description}"
+                        pending_code = current_field
                         procedure_codes[current_field] = {}
                         last_key = current_field
                         partial_key = ""
-                        logger.info(f"Detected CDT code: {current_field}")
+                        logger.debug("Detected CDT code: %s", current_field)
                         continue
                     if current_field:
                         kv = extract_insurance_kv(text.strip())
                         if kv:
                             key, value = kv
-                            # Combine multi-word keys like "History Not" and "Alternate benefit may"
-                            if key in ["History Not", "Alternate benefit may", "Member"]:
-                                if key == "History Not":
-                                    procedure_codes[current_field]["History"] = f"Not {value}"
-                                elif key == "Alternate benefit may":
-                                    procedure_codes[current_field]["Note"] = f"Alternate benefit may {value}"
-                                elif key == "Member":
-                                    procedure_codes[current_field]["Member Responsibility"] = value
+                            fields = procedure_codes[current_field]
+                            # Combine multi-word keys like "History Not" and "Alternate benefit may".
+                            # Values such as "UR" or "Not found" repeat on every code, so they are interned too.
+                            if key == "History Not":
+                                fields["History"] = sys.intern(f"Not {value}")
+                            elif key == "Alternate benefit may":
+                                fields["Note"] = f"Alternate benefit may {value}"
+                            elif key == "Member":
+                                fields["Member Responsibility"] = sys.intern(value)
                             else:
-                                procedure_codes[current_field][key] = value
-                            logger.info(f"Extracted CDT subfield for {current_field}: {key} = {value}")
+                                fields[sys.intern(key)] = sys.intern(value)
+                            logger.debug("Extracted CDT subfield for %s: %s = %s", current_field, key, value)
                             continue
                         else:
                             # Handle multi-line keys
@@ -160,105 +456,170 @@ def parse_pdf(file_path: str) -> Dict:
                 kv = extract_insurance_kv(text)
                 if kv:
                     key, value = kv
-                    logger.debug(f"Extracted KV: {key} = {value}")
+                    logger.debug("Extracted KV: %s = %s", key, value)
                     if current_section:
-                        data[current_section][key] = value
+                        data.setdefault(current_section, {})[sys.intern(key)] = value
                     else:
                         data[key] = value
-            page_tables = extract_page_tables(page)
             tables.extend(page_tables)
+            yield {"type": "page", "page": page_number, "pages": page_count}
 
         if partial_key and last_key:
             if current_section.lower() == "procedure code search":
                 procedure_codes[last_key] = {"Text": partial_key.strip()}
             else:
-                benefits_data[current_subsection or "General"][last_key] = {"Text": partial_key.strip()}
-        if benefits_data:
-            data["Benefits"] = dict(benefits_data)
+                benefits_data.setdefault(current_subsection or "General", {})[last_key] = {"Text": partial_key.strip()}
+        yield from _section_events(current_section, data, benefits_data, procedure_codes, pending_code, sent_benefits)
+        fingerprint = layout_fingerprint(fingerprint_blocks, (doc.metadata or {}).get("producer", ""))
+        result = ParseResult(data, benefits_data, procedure_codes, tables, full_text, fingerprint)
         if procedure_codes:
-            data["Procedure Codes"] = dict(procedure_codes)
-            logger.info(f"Procedure Codes extracted: {json.dumps(dict(procedure_codes), indent=2)}")
-
-        processed_data = {
-            "patient_info": extract_patient_data(data),
-            "plan_info": extract_plan_data(data),
-            "benefits": extract_benefits_data(doc, data),
-            "last_procedures": extract_procedure_dates(data),
-            "procedure_codes": extract_procedure_codes(data),
-            "raw_data": dict(data),
-            "tables": tables,
-            "full_text": "\n".join(full_text)
-        }
-        logger.debug(f"Raw parsed data: {json.dumps(processed_data, indent=2)}")
-        return processed_data
+            logger.info("Procedure Codes extracted: %s codes", len(procedure_codes))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw parsed data: %s", LazyJson(result.raw_data()))
+        PAGES.inc(page_count)
+        BLOCKS.inc(block_count)
+        KV_EXTRACTIONS.inc(_kv_timing.calls - kv_calls)
+        record_stage("extract_kv", _kv_timing.seconds - kv_seconds)
+        # Pages extracted by the parse worker processes are not included
+        for name, seconds in page_seconds.items():
+            record_stage(name, getattr(_page_timing, name) - seconds)
+        yield {"type": "result", "data": result if compact else result.to_dict()}
     finally:
         doc.close()
 
+# (pattern, key_group, value_group, literal prefix). Order matters: the first match wins.
+# The "Family/Individual (Calendar Year) Maximum/Deductible: $x" and "... Deductible Remaining: $x"
+# rules that used to follow "Pretreatment review" were dropped: the generic "key: value" rule
+# above them always matched first, so they could never fire.
+KV_RULES = [
+    (r"^(Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2, "Remaining"),
+    (r"^(Total)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2, "Total"),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(\$\d+[\d,.]*)\s*/\s*(\$\d+[\d,.]*)$", 1, 2, None),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(.+)$", 1, 2, None),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s{2,}(.+)$", 1, 2, None),
+    (r"^(D\d{4})\s+(.+)$", 1, 2, "D"),
+    (r"^([A-Z][A-Za-z ]+)\s+([\$%\d].*)$", 1, 2, None),
+    (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[-]\s*(.+)$", 1, 2, None),
+    (r"^\s*([A-Z][A-Za-z0-9 \-/():]+)\s*:\s*([^\n]+)$", 1, 2, None),
+    (r"^(.*)\s+\$([\d,.]+)$", 1, 2, None),
+    (r"^(.*)\s+(\d+%)$", 1, 2, None),
+    (r"^([A-Z][A-Za-z ]+)\s+([A-Za-z0-9 ,/]+)$", 1, 2, None),
+    (r"^(Other Insurance\?)\s+(.+)$", 1, 2, "Other Insurance?"),
+    (r"^(Pretreatment review.*)$", 0, 1, "Pretreatment review"),
+    (r"^(Family Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2, "Family Max. Remaining"),
+    (r"^(Individual Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2, "Individual Max. Remaining"),
+    (r"^(Family Maximum)\s*(\$\d+[\d,.]*)$", 1, 2, "Family Maximum"),
+    (r"^(Individual Maximum)\s*(\$\d+[\d,.]*)$", 1, 2, "Individual Maximum"),
+    (r"^(Family Deductible)\s*(\$\d+[\d,.]*)$", 1, 2, "Family Deductible"),
+    (r"^(Individual Deductible)\s*(\$\d+[\d,.]*)$", 1, 2, "Individual Deductible"),
+]
+
+_COMPILED_KV_RULES = [
+    (re.compile(pattern, re.MULTILINE | re.DOTALL), key_group, value_group, prefix)
+    for pattern, key_group, value_group, prefix in KV_RULES
+]
+TABLE_HEADER_KEYWORDS = ("coinsurance", "frequency", "procedure", "code", "maximum", "deductible")
+DOLLAR_RE = re.compile(r'\$\d+[\d,.]*')
+DOLLAR_AMOUNT_RE = re.compile(r'^\$\d+[\d,.]*$')
+TWO_SPACES_RE = re.compile(r'\s{2,}')
+CELL_SPLIT_RE = re.compile(r'\s{2,}|\t')
+FREQUENCY_ROW_RE = re.compile(r"^[A-Z][A-Za-z -]+.*(per|once|twice|exclude|no limitations)", re.IGNORECASE)
+
+_UPPER = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+_WHITESPACE_RE = re.compile(r"\s+")
+_kv_dispatch = {}
+
+def _kv_rule_accepts(pattern: str, prefix: str, first: str) -> bool:
+    if prefix is not None:
+        return first == prefix[0]
+    if pattern.startswith("^([A-Z]"):
+        return first in _UPPER
+    if pattern.startswith("^\\s*([A-Z]"):
+        return first in _UPPER or first.isspace()
+    return True
+
+def _kv_candidates(first: str) -> list:
+    # Rules that can possibly match a block starting with `first`, still in priority order
+    candidates = _kv_dispatch.get(first)
+    if candidates is None:
+        candidates = [
+            compiled for compiled, (pattern, _, _, prefix) in zip(_COMPILED_KV_RULES, KV_RULES)
+            if _kv_rule_accepts(pattern, prefix, first)
+        ]
+        _kv_dispatch[first] = candidates
+    return candidates
+
+class _KvTiming(threading.local):
+    # Per-thread running totals; parse_pdf records the per-document delta as one observation
+    calls = 0
+    seconds = 0.0
+
+_kv_timing = _KvTiming()
+
 def extract_insurance_kv(text: str) -> Tuple[str, str]:
-    patterns = [
-        (r"^(Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Total)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(\$\d+[\d,.]*)\s*/\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[:]\s*(.+)$", 1, 2),
-        (r"^([A-Z][A-Za-z0-9 \-/():]+)\s{2,}(.+)$", 1, 2),
-        (r"^(D\d{4})\s+(.+)$", 1, 2),
-        (r"^([A-Z][A-Za-z ]+)\s+([\$%\d].*)$", 1, 2),
-        (r"^([A-Z][A-Za-z0-9 \-/():]+)\s*[-]\s*(.+)$", 1, 2),
-        (r"^\s*([A-Z][A-Za-z0-9 \-/():]+)\s*:\s*([^\n]+)$", 1, 2),
-        (r"^(.*)\s+\$([\d,.]+)$", 1, 2),
-        (r"^(.*)\s+(\d+%)$", 1, 2),
-        (r"^([A-Z][A-Za-z ]+)\s+([A-Za-z0-9 ,/]+)$", 1, 2),
-        (r"^(Other Insurance\?)\s+(.+)$", 1, 2),
-        (r"^(Pretreatment review.*)$", 0, 1),
-        (r"^(Family Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Max\. Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Deductible Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Deductible Remaining)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Calendar Year Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Calendar Year Maximum)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Calendar Year Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Calendar Year Deductible)\s*[:]\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Maximum)\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Maximum)\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Family Deductible)\s*(\$\d+[\d,.]*)$", 1, 2),
-        (r"^(Individual Deductible)\s*(\$\d+[\d,.]*)$", 1, 2),
-    ]
-    for pattern, key_group, value_group in patterns:
-        match = re.match(pattern, text, re.MULTILINE | re.DOTALL)
+    start = time.perf_counter()
+    try:
+        return _match_insurance_kv(text)
+    finally:
+        _kv_timing.calls += 1
+        _kv_timing.seconds += time.perf_counter() - start
+
+def _match_insurance_kv(text: str) -> Tuple[str, str]:
+    if not text:
+        candidates = _COMPILED_KV_RULES
+    else:
+        candidates = _kv_candidates(text[0])
+    for regex, key_group, value_group, prefix in candidates:
+        if prefix is not None and not text.startswith(prefix):
+            continue
+        match = regex.match(text)
         if match:
-            key = re.sub(r"\s+", " ", match.group(key_group).strip()) if key_group > 0 else match.group(1).strip()
-            value = re.sub(r"\s+", " ", match.group(value_group).strip())
+            key = _WHITESPACE_RE.sub(" ", match.group(key_group).strip()) if key_group > 0 else match.group(1).strip()
+            value = _WHITESPACE_RE.sub(" ", match.group(value_group).strip())
             return key, value
     return None
 
 def extract_page_tables(page) -> List[Dict]:
+    _, lines = extract_page_content(page)
+    return extract_tables_from_lines(lines)
+
+def extract_tables_from_lines(lines: List[str]) -> List[Dict]:
     tables = []
-    text = page.get_text("text")
-    lines = [line.strip() for line in text.splitlines() if line.strip()]
     current_table = []
     headers = None
     benefits_table = []
     in_benefits_section = False
+    frequency_table = []
+    in_frequency_section = False
 
     for line in lines:
-        if "benefits" in line.lower():
+        line_lower = line.lower()
+        # The frequency table is tracked independently of the generic/benefits state below
+        if "frequency & limitations" in line_lower:
+            in_frequency_section = True
+        elif in_frequency_section and FREQUENCY_ROW_RE.match(line):
+            parts = TWO_SPACES_RE.split(line.strip(), 1)
+            if len(parts) == 2:
+                frequency_table.append({"Procedure": parts[0].strip(), "Frequency": parts[1].strip()})
+            elif len(parts) == 1 and frequency_table:
+                frequency_table[-1]["Frequency"] += " " + parts[0].strip()
+        elif in_frequency_section and ("total" in line_lower or "plan details" in line_lower):
+            in_frequency_section = False
+
+        if "benefits" in line_lower:
             in_benefits_section = True
             headers = ["Field", "Remaining", "Total"]
-            logger.debug(f"Started benefits table extraction with headers: {headers}")
+            logger.debug("Started benefits table extraction with headers: %s", headers)
             continue
         if in_benefits_section:
-            if re.search(r'\$\d+[\d,.]*', line):
-                parts = re.split(r'\s{2,}', line.strip())
+            if DOLLAR_RE.search(line):
+                parts = TWO_SPACES_RE.split(line.strip())
                 if len(parts) >= 2:
                     field = parts[0].strip()
                     remaining = ""
                     total = ""
                     for part in parts[1:]:
-                        if re.match(r'^\$\d+[\d,.]*$', part):
+                        if DOLLAR_AMOUNT_RE.match(part):
                             if not remaining:
                                 remaining = part
                             else:
@@ -266,20 +627,20 @@ def extract_page_tables(page) -> List[Dict]:
                     if remaining:
                         row = {"Field": field, "Remaining": remaining, "Total": total if total else ""}
                         benefits_table.append(row)
-                        logger.debug(f"Extracted benefits table row: {row}")
-            elif any(keyword in line.lower() for keyword in ["plan details", "frequency & limitations"]):
+                        logger.debug("Extracted benefits table row: %s", row)
+            elif "plan details" in line_lower or "frequency & limitations" in line_lower:
                 in_benefits_section = False
                 if benefits_table:
                     tables.append(benefits_table)
-                    logger.debug(f"Benefits table: {benefits_table}")
+                    logger.debug("Benefits table: %s", benefits_table)
                 benefits_table = []
                 continue
 
-        if any(keyword in line.lower() for keyword in ["coinsurance", "frequency", "procedure", "code", "maximum", "deductible"]):
-            headers = [h.strip() for h in re.split(r'\s{2,}|\t', line) if h.strip()]
-            logger.debug(f"Table headers: {headers}")
+        if any(keyword in line_lower for keyword in TABLE_HEADER_KEYWORDS):
+            headers = [h.strip() for h in CELL_SPLIT_RE.split(line) if h.strip()]
+            logger.debug("Table headers: %s", headers)
             continue
-        row = [c.strip() for c in re.split(r'\s{2,}|\t', line) if c.strip()]
+        row = [c.strip() for c in CELL_SPLIT_RE.split(line) if c.strip()]
         if headers and len(row) >= len(headers):
             row_dict = dict(zip(headers[:len(row)], row))
             current_table.append(row_dict)
@@ -291,26 +652,10 @@ def extract_page_tables(page) -> List[Dict]:
         tables.append(current_table)
     if benefits_table:
         tables.append(benefits_table)
-        logger.debug(f"Benefits table: {benefits_table}")
-
-    frequency_table = []
-    in_frequency_section = False
-    for line in lines:
-        if "frequency & limitations" in line.lower():
-            in_frequency_section = True
-            headers = ["Procedure", "Frequency"]
-            continue
-        if in_frequency_section and re.match(r"^[A-Z][A-Za-z -]+.*(per|once|twice|exclude|no limitations)", line, re.IGNORECASE):
-            parts = re.split(r'\s{2,}', line.strip(), 1)
-            if len(parts) == 2:
-                frequency_table.append({"Procedure": parts[0].strip(), "Frequency": parts[1].strip()})
-            elif len(parts) == 1 and frequency_table:
-                frequency_table[-1]["Frequency"] += " " + parts[0].strip()
-        elif in_frequency_section and any(keyword in line.lower() for keyword in ["total", "plan details"]):
-            in_frequency_section = False
+        logger.debug("Benefits table: %s", benefits_table)
     if frequency_table:
         tables.append(frequency_table)
-        logger.debug(f"Frequency table: {frequency_table}")
+        logger.debug("Frequency table: %s", frequency_table)
     return tables
 
 def extract_patient_data(data: Dict) -> Dict:
@@ -331,7 +676,7 @@ def extract_patient_data(data: Dict) -> Dict:
                 "address": d.get("Address", "")
             })
             break
-    logger.debug(f"Patient data: {patient}")
+    logger.debug("Patient data: %s", patient)
     return patient
 
 def extract_plan_data(data: Dict) -> Dict:
@@ -352,13 +697,13 @@ def extract_plan_data(data: Dict) -> Dict:
                 "participation_type": d.get("Participation Type", "") or d.get("Network Type", "") or d.get("Participation", "")
             })
             break
-    logger.debug(f"Plan data: {plan}")
+    logger.debug("Plan data: %s", plan)
     return plan
 
 def validate_dollar_amount(value: str) -> str:
     if re.match(r'^\$\d+[\d,.]*$', value):
         return value
-    logger.debug(f"Invalid dollar amount: {value}")
+    logger.debug("Invalid dollar amount: %s", value)
     return ""
 
 def extract_benefits_data(doc: fitz.Document, data: Dict) -> Dict:
@@ -384,12 +729,12 @@ def extract_benefits_data(doc: fitz.Document, data: Dict) -> Dict:
         "pre_auth": extract_pre_auth(data)
     }
 
-    logger.debug(f"Raw data sections: {json.dumps(dict(data), indent=2)}")
+    logger.debug("Raw data sections: %s", LazyJson(data))
 
     for section in ["Benefits"]:
         if section in data:
             d = data[section]
-            logger.debug(f"Processing section {section}: {d}")
+            logger.debug("Processing section %s: %s", section, d)
             if "Deductible" in d:
                 subsection = d["Deductible"]
                 for key, subfields in subsection.items():
@@ -399,11 +744,11 @@ def extract_benefits_data(doc: fitz.Document, data: Dict) -> Dict:
                         if "Individual Calendar Year Deductible" in key or "Individual Deductible" in key:
                             benefits["deductible"]["individual_remaining"] = remaining
                             benefits["deductible"]["individual_total"] = total
-                            logger.debug(f"Extracted Individual Deductible: Remaining={remaining}, Total={total}")
+                            logger.debug("Extracted Individual Deductible: Remaining=%s, Total=%s", remaining, total)
                         elif "Family Calendar Year Deductible" in key or "Family Deductible" in key:
                             benefits["deductible"]["family_remaining"] = remaining
                             benefits["deductible"]["family_total"] = total
-                            logger.debug(f"Extracted Family Deductible: Remaining={remaining}, Total={total}")
+                            logger.debug("Extracted Family Deductible: Remaining=%s, Total=%s", remaining, total)
             if "Benefit Maximums" in d:
                 subsection = d["Benefit Maximums"]
                 for key, subfields in subsection.items():
@@ -415,16 +760,16 @@ def extract_benefits_data(doc: fitz.Document, data: Dict) -> Dict:
                             if "Individual Lifetime Maximum" in ortho_key:
                                 benefits["maximum"]["family_remaining"] = remaining
                                 benefits["maximum"]["family_total"] = total
-                                logger.debug(f"Extracted Family Maximum (Orthodontics): Remaining={remaining}, Total={total}")
+                                logger.debug("Extracted Family Maximum (Orthodontics): Remaining=%s, Total=%s", remaining, total)
                     elif isinstance(subfields, dict):
                         remaining = validate_dollar_amount(subfields.get("Remaining", ""))
                         total = validate_dollar_amount(subfields.get("Total", ""))
                         if "Individual Calendar Year Maximum" in key or "Individual Maximum" in key:
                             benefits["maximum"]["individual_remaining"] = remaining
                             benefits["maximum"]["individual_total"] = total
-                            logger.debug(f"Extracted Individual Maximum: Remaining={remaining}, Total={total}")
+                            logger.debug("Extracted Individual Maximum: Remaining=%s, Total=%s", remaining, total)
 
-    logger.debug(f"Final Benefits data: {json.dumps(benefits, indent=2)}")
+    logger.debug("Final Benefits data: %s", LazyJson(benefits))
     return benefits
 
 def extract_coinsurance(data: Dict) -> Dict:
@@ -440,7 +785,7 @@ def extract_coinsurance(data: Dict) -> Dict:
                 "orthodontics": d.get("Orthodontics", "")
             })
             break
-    logger.debug(f"Coinsurance: {coinsurance}")
+    logger.debug("Coinsurance: %s", coinsurance)
     return coinsurance
 
 def extract_frequencies(data: Dict) -> Dict:
@@ -476,7 +821,7 @@ def extract_frequencies(data: Dict) -> Dict:
                     frequencies["crown"] = value
                 elif "bridge work" in key_lower:
                     frequencies["bridgeWork"] = value
-    logger.debug(f"Frequencies: {frequencies}")
+    logger.debug("Frequencies: %s", frequencies)
     return frequencies
 
 def extract_pre_auth(data: Dict) -> str:
@@ -498,12 +843,12 @@ def extract_procedure_dates(data: Dict) -> Dict:
             for key, value in data[section].items():
                 if "History" in key and "No history" not in value:
                     procedures[key] = value
-    logger.debug(f"Procedure dates: {procedures}")
+    logger.debug("Procedure dates: %s", procedures)
     return procedures
 
 def extract_procedure_codes(data: Dict) -> Dict:
     procedure_codes = {}
     if "Procedure Codes" in data:
         procedure_codes = data["Procedure Codes"]
-    logger.info(f"Procedure codes returned: {json.dumps(procedure_codes, indent=2)}")
+    logger.debug("Procedure codes returned: %s", LazyJson(procedure_codes))
     return procedure_codes
\ No newline at end of file
@@ -0,0 +1,101 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    def __init__(self, namespace: str, max_size: int = 256, ttl: float = 3600, path: Optional[str] = None):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, stored_at REAL NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+            logger.info(f"Using on-disk {namespace} cache at {path}")
+
+    def _is_fresh(self, stored_at: float) -> bool:
+        return self.ttl <= 0 or time.time() - stored_at < self.ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            expired = False
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self._is_fresh(stored_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self._entries[key]
+                expired = True
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, value FROM results WHERE namespace = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+                if row and self._is_fresh(row[0]):
+                    self._remember(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return json.loads(row[1])
+                if row:
+                    self._db.execute("DELETE FROM results WHERE namespace = ? AND key = ?", (self.namespace, key))
+                    self._db.commit()
+                    expired = True
+            self.expired += expired
+            self.misses += 1
+            return None
+
+    def _remember(self, key: str, stored_at: float, value: str) -> None:
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any) -> None:
+        # Values are stored serialized so callers never share mutable state through the cache
+        serialized = json.dumps(value, separators=(",", ":"))
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, serialized)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (namespace, key, stored_at, value) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, stored_at, serialized)
+                )
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = self.expired = 0
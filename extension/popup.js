@@ -43,7 +43,8 @@ document.addEventListener('DOMContentLoaded', () => {
       const formData = new FormData();
       formData.append('file', file);
 
-      const response = await fetch('http://localhost:8000/parse-pdf/', {
+      // Only ask for what the popup renders; fullText and tables are never built server-side
+      const response = await fetch('http://localhost:8000/parse-pdf/?include=mappedFields,rawData', {
         method: 'POST',
         body: formData
       });
@@ -59,12 +60,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
       localStorage.setItem(`eligibilityData_${file.name}`, JSON.stringify(data.data));
 
-      // Debug the response data
-      console.log('Full Response Data:', JSON.stringify(data, null, 2));
-      console.log('data.data:', JSON.stringify(data.data, null, 2));
-      console.log('data.data.rawData:', JSON.stringify(data.data.rawData, null, 2));
-      console.log('data.data.procedure_codes:', JSON.stringify(data.data.procedure_codes, null, 2));
-
       const { mappedFields, rawData } = data.data;
       let html = `<div class="file-result"><strong>${file.name}</strong><br>`;
 
@@ -165,7 +160,6 @@ document.addEventListener('DOMContentLoaded', () => {
 
       // Procedure Codes - Try multiple sources
       let procedureCodes = data.data.procedure_codes || rawData.procedure_codes || rawData["Procedure Codes"] || {};
-      console.log('Procedure Codes Data:', JSON.stringify(procedureCodes, null, 2));
 
       html += `<strong>Procedure Codes:</strong><br>`;
       if (Object.keys(procedureCodes).length === 0) {